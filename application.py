@@ -1,13 +1,25 @@
-from flask import Flask, request, render_template_string, redirect, url_for, flash
+from flask import Flask, Response, g, request, render_template_string, redirect, url_for, flash
 from flask_sqlalchemy import SQLAlchemy
-from flask_apscheduler import APScheduler
-from datetime import datetime
+from datetime import datetime, timedelta
+import os
+
+from db_migrations import add_column, migrate
+from health_db import (DATABASE_URL, ENGINE_OPTIONS, LEASE_SECONDS, WriteBatcher, configure_engine,
+                       lease_free, new_worker_id)
+from metrics import REGISTRY, inc, stage
+from reminder_recurrence import WEEKDAYS, expand_listing, fire_occurrence, is_recurring, make_rule
+from reminder_scheduler import ReminderScheduler
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///health_tracker.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = ENGINE_OPTIONS
 app.config['SECRET_KEY'] = 'secret-key-123'
 db = SQLAlchemy(app)
-scheduler = APScheduler()
+
+# Same WAL / busy_timeout settings as final.py; adds go through one writer
+with app.app_context():
+    configure_engine(db.engine)
+    write_batcher = WriteBatcher(db.engine)
 
 
 
@@ -17,6 +29,43 @@ class Record(db.Model):
     name = db.Column(db.String(100), nullable=False)
     scheduled_time = db.Column(db.DateTime, nullable=False)
     status = db.Column(db.String(20), default='Pending') 
+    claimed_by = db.Column(db.String(100))  # replica holding the lease
+    lease_expires = db.Column(db.DateTime)
+    # Recurring schedule (see reminder_recurrence); parent_id marks a fired dose
+    parent_id = db.Column(db.Integer)
+    repeat_minutes = db.Column(db.Integer)
+    repeat_days = db.Column(db.Integer)
+    repeat_until = db.Column(db.DateTime)
+    repeat_count = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index('ix_record_status_time', 'status', 'scheduled_time'),
+        db.Index('ix_record_scheduled_time', 'scheduled_time'),
+        # Only schedule rows, so listing them stays cheap however many one-offs exist
+        db.Index('ix_record_schedules', 'status', sqlite_where=db.text('repeat_minutes IS NOT NULL')),
+    )
+
+# Brings databases created before the indexes / lease / recurrence columns existed up to date
+RECORD_MIGRATIONS = [
+    (1, "index record(status, scheduled_time) and record(scheduled_time)", [
+        "CREATE INDEX IF NOT EXISTS ix_record_status_time ON record (status, scheduled_time)",
+        "CREATE INDEX IF NOT EXISTS ix_record_scheduled_time ON record (scheduled_time)",
+    ]),
+    (2, "record lease columns", [
+        add_column('record', 'claimed_by', 'VARCHAR(100)'),
+        add_column('record', 'lease_expires', 'DATETIME'),
+    ]),
+    (3, "record recurrence columns", [
+        add_column('record', 'parent_id', 'INTEGER'),
+        add_column('record', 'repeat_minutes', 'INTEGER'),
+        add_column('record', 'repeat_days', 'INTEGER'),
+        add_column('record', 'repeat_until', 'DATETIME'),
+        add_column('record', 'repeat_count', 'INTEGER'),
+    ]),
+    (4, "partial index record(status) for recurring schedules", [
+        "CREATE INDEX IF NOT EXISTS ix_record_schedules ON record (status) WHERE repeat_minutes IS NOT NULL",
+    ]),
+]
 
 
 
@@ -57,6 +106,22 @@ HTML_TEMPLATE = """
                             <button type="submit" class="btn btn-primary w-100">Add</button>
                         </div>
                     </div>
+                    <div class="row g-3 mt-1">
+                        <div class="col-md-3">
+                            <input type="number" name="repeat_hours" min="0" class="form-control" placeholder="Repeat every (hours)">
+                        </div>
+                        <div class="col-md-4">
+                            {% for day in weekdays %}
+                            <label class="form-check-label me-1"><input type="checkbox" name="days" value="{{ loop.index0 }}" class="form-check-input"> {{ day }}</label>
+                            {% endfor %}
+                        </div>
+                        <div class="col-md-3">
+                            <input type="date" name="until" class="form-control" title="Until">
+                        </div>
+                        <div class="col-md-2">
+                            <input type="number" name="count" min="0" class="form-control" placeholder="Doses">
+                        </div>
+                    </div>
                 </form>
             </div>
         </div>
@@ -87,6 +152,11 @@ HTML_TEMPLATE = """
                 {% endfor %}
             </tbody>
         </table>
+
+        <nav class="d-flex justify-content-between">
+            <a class="btn btn-outline-secondary btn-sm {{ '' if paged else 'disabled' }}" href="{{ url_for('index') }}">&laquo; First</a>
+            <a class="btn btn-outline-secondary btn-sm {{ '' if next_after else 'disabled' }}" href="{{ url_for('index', after=next_after) if next_after else '#' }}">Next &raquo;</a>
+        </nav>
     </div>
 </body>
 </html>
@@ -94,10 +164,31 @@ HTML_TEMPLATE = """
 
 
 
+PAGE_SIZE = 50
+
+# Keyset pagination on (scheduled_time, id): ?after=<iso time>,<id>
+# Recurring schedules are expanded into their upcoming doses for this page only
 @app.route('/')
 def index():
-    records = Record.query.order_by(Record.scheduled_time.asc()).all()
-    return render_template_string(HTML_TEMPLATE, records=records)
+    query = Record.query.filter(Record.repeat_minutes.is_(None))
+    after = request.args.get('after')
+    if after:
+        try:
+            time_str, record_id = after.rsplit(',', 1)
+            after = (datetime.fromisoformat(time_str), int(record_id))
+        except ValueError:
+            return 'Invalid page cursor', 400
+        query = query.filter(db.tuple_(Record.scheduled_time, Record.id) > db.tuple_(*after))
+    rows = query.order_by(Record.scheduled_time.asc(), Record.id.asc()).limit(PAGE_SIZE + 1).all()
+    schedules = Record.query.filter(Record.status == 'Pending', Record.repeat_minutes.isnot(None)).all()
+    rows = expand_listing(rows, schedules, after, PAGE_SIZE + 1)
+    records = rows[:PAGE_SIZE]
+
+    next_after = None
+    if len(rows) > PAGE_SIZE:
+        last = records[-1]
+        next_after = f"{last.scheduled_time.isoformat()},{last.id}"
+    return render_template_string(HTML_TEMPLATE, records=records, next_after=next_after, paged=bool(after), weekdays=WEEKDAYS)
 
 @app.route('/add', methods=['POST'])
 def add_record():
@@ -109,30 +200,107 @@ def add_record():
     scheduled_time = datetime.strptime(time_str, '%Y-%m-%dT%H:%M')
     
     new_record = Record(category=category, name=name, scheduled_time=scheduled_time)
-    db.session.add(new_record)
-    db.session.commit()
+    repeat_hours = request.form.get('repeat_hours', type=int)
+    if repeat_hours:
+        until = request.form.get('until')
+        try:
+            rule = make_rule(
+                scheduled_time, repeat_hours * 60, request.form.getlist('days', type=int),
+                datetime.strptime(until + ' 23:59:59', '%Y-%m-%d %H:%M:%S') if until else None,
+                request.form.get('count', type=int)
+            )
+        except ValueError as e:
+            return str(e), 400
+        for column, value in rule.items():
+            setattr(new_record, column, value)
+    write_batcher.submit(lambda session: session.add(new_record)).result()
+    # Wakes the scheduler early if this is now the next reminder due
+    reminder_scheduler.add(new_record.scheduled_time, new_record.id)
     return redirect(url_for('index'))
 
+# Every request is timed as "http_<endpoint>" (and sampled for profiling,
+# see metrics.py); /metrics serves all stage timings for Prometheus
+@app.before_request
+def start_request_timer():
+    g.request_timer = REGISTRY.request(f"http_{request.endpoint or 'unknown'}")
+    g.request_timer.__enter__()
 
+@app.teardown_request
+def stop_request_timer(error=None):
+    timer = g.pop('request_timer', None)
+    if timer is not None:
+        timer.__exit__(None, None, None)
 
-def check_reminders():
-    with app.app_context():
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+
+# Several replicas may run this app against one database: each one claims the
+# due rows with a lease before notifying, so a reminder fires once, and a row
+# claimed by a replica that died is picked up again when the lease runs out.
+WORKER_ID = new_worker_id()
+
+def load_pending():
+    with app.app_context(), stage('reminder_load_pending'):
+        # Rows leased by another replica are due again when the lease expires
+        due_at = db.func.max(Record.scheduled_time, db.func.coalesce(Record.lease_expires, Record.scheduled_time))
+        return db.session.query(due_at, Record.id).filter(Record.status == 'Pending').all()
+
+def check_reminders(ids):
+    with app.app_context(), stage('reminder_check'):
         now = datetime.now()
-       
-        due_tasks = Record.query.filter(Record.scheduled_time <= now, Record.status == 'Pending').all()
+        expires = now + timedelta(seconds=LEASE_SECONDS)
+        Record.query.filter(
+            Record.id.in_(ids), Record.status == 'Pending', lease_free(Record, now)
+        ).update({'claimed_by': WORKER_ID, 'lease_expires': expires}, synchronize_session=False)
+        db.session.commit()
+
+        due_tasks = Record.query.filter(
+            Record.id.in_(ids), Record.claimed_by == WORKER_ID, Record.lease_expires == expires
+        ).all()
         
+        schedules = []
         for task in due_tasks:
             print(f"NOTIFICATION: Time for your {task.category}: {task.name}!")
-            task.status = 'Reminded'
-            db.session.commit()
+            inc('reminders_sent')
+            if is_recurring(task):
+                # Keep the dose that fired; the schedule moves on to the next one
+                dose = fire_occurrence(task)
+                dose.status = 'Reminded'
+                db.session.add(dose)
+                schedules.append(task)
+
+        # One UPDATE for the whole batch
+        Record.query.filter(
+            Record.id.in_([task.id for task in due_tasks if not is_recurring(task)]),
+            Record.claimed_by == WORKER_ID, Record.status == 'Pending'
+        ).update({'status': 'Reminded', 'lease_expires': None}, synchronize_session=False)
+        db.session.commit()
+
+        for task in schedules:
+            if task.status == 'Pending':
+                reminder_scheduler.add(task.scheduled_time, task.id)
+
+        # Held by a live replica: check back when its lease runs out
+        for record_id, lease_expires in db.session.query(Record.id, Record.lease_expires).filter(
+            Record.id.in_(ids), Record.status == 'Pending', Record.claimed_by != WORKER_ID
+        ):
+            reminder_scheduler.add(lease_expires, record_id)
+
+reminder_scheduler = ReminderScheduler(load_pending, check_reminders)
 
 if __name__ == '__main__':
     with app.app_context():
         db.create_all() 
+        migrate(db.engine, 'record', RECORD_MIGRATIONS)
         
-    scheduler.add_job(id='reminder_job', func=check_reminders, trigger='interval', seconds=10)
-    scheduler.start()
+    debug = True
+    # With the debug reloader only the serving child process schedules
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        reminder_scheduler.start()
     
-    app.run(debug=True)
+    app.run(debug=debug)
 
 
@@ -1,191 +1,450 @@
-import pandas as pd
-import pdfplumber
 import re
 import os
 import sys
+import argparse
+import glob
+import json
+import time
+from contextlib import redirect_stdout
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from functools import lru_cache
+
+from lab_matcher import AliasMatcher
+from lab_reference import get_reference
+from lab_templates import LayoutTemplates
+from metrics import REGISTRY, inc, observe, stage
+from pdf_extract import (MemoryLimitExceeded, open_pdf, page_texts, rereadable, scan_pages,
+                         split_reports)
 
 # ==========================================
 # 1. DATABASE SETUP
 # ==========================================
-def ensure_database_exists():
-    filename = "lab_data.csv"
-    
-    data = {
-        "Medical Term": [
-            "Glucose (Fasting)", 
-            "Hemoglobin", "RBC Count", "Hematocrit (PCV)", "MCV", "MCH", "MCHC", 
-            "RDW", "Total WBC", "Neutrophils", "Lymphocytes", "Monocytes", 
-            "Eosinophils", "Basophils", "Platelets",
-            "BUN", "Creatinine", "Blood Urea", "Calcium", "Phosphorus", "Uric Acid",
-            "Total Cholesterol", "Triglycerides", "HDL Cholesterol", "VLDL Cholesterol", 
-            "LDL Cholesterol", "Chol/HDL Ratio",
-            "Total Bilirubin", "Direct Bilirubin", "Indirect Bilirubin", 
-            "Total Protein", "Albumin", "Globulin", "A/G Ratio", 
-            "SGOT (AST)", "SGPT (ALT)", "GGT", "Alkaline Phosphatase"
-        ],
-        "Simple English": [
-            "Blood Sugar Level",
-            "Oxygen Carrier Protein", "Red Blood Cell Count", "Packed Cell Volume", "Avg RBC Size", "Avg Hemoglobin Amount", "Avg Hemoglobin Concentration",
-            "RBC Size Variation", "Total Immune Cells", "Bacterial Fighters", "Viral Fighters", "Cleanup Cells",
-            "Allergy Fighters", "Inflammation Fighters", "Clotting Cells",
-            "Blood Urea Nitrogen", "Kidney Waste Filter", "Nitrogen Waste", "Bone Mineral", "Bone Health Mineral", "Gout Marker",
-            "Total Fat in Blood", "Fat from Calories", "Good Cholesterol", "Very Bad Cholesterol",
-            "Bad Cholesterol", "Heart Risk Ratio",
-            "Total Bile Pigment", "Processed Bile Pigment", "Unprocessed Bile Pigment",
-            "Total Blood Proteins", "Liver Protein", "Immune Proteins", "Protein Balance",
-            "Liver Enzyme (AST)", "Liver Enzyme (ALT)", "Bile Duct Enzyme", "Bone/Liver Enzyme"
-        ],
-        "Unit": [
-            "mg/dL", 
-            "g/dL", "mil/uL", "%", "fL", "pg", "g/dL", 
-            "%", "cells/cumm", "/cumm", "/cumm", "/cumm", "/cumm", "/cumm", "/cumm", 
-            "mg/dL", "mg/dL", "mg/dL", "mg/dL", "mg/dL", "mg/dL", 
-            "mg/dL", "mg/dL", "mg/dL", "mg/dL", "mg/dL", "ratio", 
-            "mg/dL", "mg/dL", "mg/dL", "g/dL", "g/dL", "g/dL", "ratio", 
-            "U/L", "U/L", "U/L", "U/L"
-        ],
-        "Min": [
-            70, 
-            13.0, 4.5, 40.0, 83.0, 27.0, 31.5, 
-            11.6, 4000, 2000, 1000, 200, 100, 0, 150000, 
-            5.0, 0.7, 15.0, 8.4, 2.7, 3.0, 
-            0, 0, 40, 2, 0, 0, 
-            0.1, 0.0, 0.1, 6.0, 3.5, 2.0, 1.0, 
-            5, 5, 5, 30
-        ],
-        "Max": [
-            110, 
-            17.0, 5.5, 50.0, 101.0, 32.0, 34.5, 
-            14.0, 10000, 7000, 3000, 1000, 500, 100, 450000, 
-            18.0, 1.2, 45.0, 10.2, 4.9, 7.0, 
-            200, 150, 60, 30, 100, 5.0, 
-            1.2, 0.3, 0.9, 8.0, 5.0, 3.5, 2.0, 
-            40, 40, 50, 120
-        ],
-        "Explanation": [
-            "Energy source. High = Diabetes risk.",
-            "Carries oxygen. Low = Anemia.", "Number of red cells.", "Percentage of blood that is cells.", "Size of red cells. High = B12 deficiency.", "Weight of Hb in cells.", "Concentration of Hb.",
-            "Variation in cell size. High = Mixed anemia.", "Overall immune strength.", "Fight bacteria. High = Bacterial infection.", "Fight viruses. High = Viral infection.", "Clear debris. High = Chronic infection.",
-            "Fight parasites/allergies.", "Rare immune cells.", "Stop bleeding. Low = Bruising risk.",
-            "Waste from protein. High = Kidney stress.", "Muscle waste filtered by kidneys. High = Kidney issues.", "Waste product.", "Crucial for bones/nerves.", "Works with calcium for bones.", "High levels cause Gout (joint pain).",
-            "Overall cholesterol health.", "Fat from sugar/carbs.", "Protects heart. Higher is better.", "Carries fat to tissues. High = Risk.",
-            "Clogs arteries. Lower is better.", "Ratio of bad to good cholesterol.",
-            "Yellow pigment. High = Jaundice.", "Processed by liver.", "Not yet processed.",
-            "Overall nutritional status.", "Main liver protein. Low = Liver disease.", "Immune system proteins.", "Balance of proteins.",
-            "Released when liver cells damaged.", "Most specific liver enzyme.", "Bile duct damage marker.", "Bone or liver issue marker."
-        ]
-    }
-    
-    # Overwrite DB to ensure correctness
-    pd.DataFrame(data).to_csv(filename, index=False)
+LAB_DATA = {
+    "Medical Term": [
+        "Glucose (Fasting)", 
+        "Hemoglobin", "RBC Count", "Hematocrit (PCV)", "MCV", "MCH", "MCHC", 
+        "RDW", "Total WBC", "Neutrophils", "Lymphocytes", "Monocytes", 
+        "Eosinophils", "Basophils", "Platelets",
+        "BUN", "Creatinine", "Blood Urea", "Calcium", "Phosphorus", "Uric Acid",
+        "Total Cholesterol", "Triglycerides", "HDL Cholesterol", "VLDL Cholesterol", 
+        "LDL Cholesterol", "Chol/HDL Ratio",
+        "Total Bilirubin", "Direct Bilirubin", "Indirect Bilirubin", 
+        "Total Protein", "Albumin", "Globulin", "A/G Ratio", 
+        "SGOT (AST)", "SGPT (ALT)", "GGT", "Alkaline Phosphatase"
+    ],
+    "Simple English": [
+        "Blood Sugar Level",
+        "Oxygen Carrier Protein", "Red Blood Cell Count", "Packed Cell Volume", "Avg RBC Size", "Avg Hemoglobin Amount", "Avg Hemoglobin Concentration",
+        "RBC Size Variation", "Total Immune Cells", "Bacterial Fighters", "Viral Fighters", "Cleanup Cells",
+        "Allergy Fighters", "Inflammation Fighters", "Clotting Cells",
+        "Blood Urea Nitrogen", "Kidney Waste Filter", "Nitrogen Waste", "Bone Mineral", "Bone Health Mineral", "Gout Marker",
+        "Total Fat in Blood", "Fat from Calories", "Good Cholesterol", "Very Bad Cholesterol",
+        "Bad Cholesterol", "Heart Risk Ratio",
+        "Total Bile Pigment", "Processed Bile Pigment", "Unprocessed Bile Pigment",
+        "Total Blood Proteins", "Liver Protein", "Immune Proteins", "Protein Balance",
+        "Liver Enzyme (AST)", "Liver Enzyme (ALT)", "Bile Duct Enzyme", "Bone/Liver Enzyme"
+    ],
+    "Unit": [
+        "mg/dL", 
+        "g/dL", "mil/uL", "%", "fL", "pg", "g/dL", 
+        "%", "cells/cumm", "/cumm", "/cumm", "/cumm", "/cumm", "/cumm", "/cumm", 
+        "mg/dL", "mg/dL", "mg/dL", "mg/dL", "mg/dL", "mg/dL", 
+        "mg/dL", "mg/dL", "mg/dL", "mg/dL", "mg/dL", "ratio", 
+        "mg/dL", "mg/dL", "mg/dL", "g/dL", "g/dL", "g/dL", "ratio", 
+        "U/L", "U/L", "U/L", "U/L"
+    ],
+    "Min": [
+        70, 
+        13.0, 4.5, 40.0, 83.0, 27.0, 31.5, 
+        11.6, 4000, 2000, 1000, 200, 100, 0, 150000, 
+        5.0, 0.7, 15.0, 8.4, 2.7, 3.0, 
+        0, 0, 40, 2, 0, 0, 
+        0.1, 0.0, 0.1, 6.0, 3.5, 2.0, 1.0, 
+        5, 5, 5, 30
+    ],
+    "Max": [
+        110, 
+        17.0, 5.5, 50.0, 101.0, 32.0, 34.5, 
+        14.0, 10000, 7000, 3000, 1000, 500, 100, 450000, 
+        18.0, 1.2, 45.0, 10.2, 4.9, 7.0, 
+        200, 150, 60, 30, 100, 5.0, 
+        1.2, 0.3, 0.9, 8.0, 5.0, 3.5, 2.0, 
+        40, 40, 50, 120
+    ],
+    "Explanation": [
+        "Energy source. High = Diabetes risk.",
+        "Carries oxygen. Low = Anemia.", "Number of red cells.", "Percentage of blood that is cells.", "Size of red cells. High = B12 deficiency.", "Weight of Hb in cells.", "Concentration of Hb.",
+        "Variation in cell size. High = Mixed anemia.", "Overall immune strength.", "Fight bacteria. High = Bacterial infection.", "Fight viruses. High = Viral infection.", "Clear debris. High = Chronic infection.",
+        "Fight parasites/allergies.", "Rare immune cells.", "Stop bleeding. Low = Bruising risk.",
+        "Waste from protein. High = Kidney stress.", "Muscle waste filtered by kidneys. High = Kidney issues.", "Waste product.", "Crucial for bones/nerves.", "Works with calcium for bones.", "High levels cause Gout (joint pain).",
+        "Overall cholesterol health.", "Fat from sugar/carbs.", "Protects heart. Higher is better.", "Carries fat to tissues. High = Risk.",
+        "Clogs arteries. Lower is better.", "Ratio of bad to good cholesterol.",
+        "Yellow pigment. High = Jaundice.", "Processed by liver.", "Not yet processed.",
+        "Overall nutritional status.", "Main liver protein. Low = Liver disease.", "Immune system proteins.", "Balance of proteins.",
+        "Released when liver cells damaged.", "Most specific liver enzyme.", "Bile duct damage marker.", "Bone or liver issue marker."
+    ]
+}
 
-ensure_database_exists()
+# Seeds the CSV on first use only; editing the CSV is picked up on the
+# next lookup (see lab_reference.get_reference)
+LAB_DATA_FILE = "terminal_lab_data.csv"
+
+def get_lab_reference():
+    return get_reference(LAB_DATA_FILE, seed=LAB_DATA)
 
 # ==========================================
 # 2. LOGIC ENGINE
 # ==========================================
 class MedicalInterpreter:
     def __init__(self):
-        self.db = pd.read_csv("lab_data.csv")
+        self.table = get_lab_reference()
     
     def get_known_tests(self):
-        return self.db['Medical Term'].tolist()
+        return list(self.table.terms)
 
     def analyze(self, term, value):
-        record = self.db[self.db['Medical Term'] == term]
-        if record.empty: return None
-            
-        row = record.iloc[0]
-        min_val, max_val = float(row['Min']), float(row['Max'])
-        
-        if value < min_val:
-            status = "LOW"
-        elif value > max_val:
-            status = "HIGH"
-        else:
-            status = "NORMAL"
+        row = self.table.row(term)
+        if row is None: return None
             
         return {
             "simple_name": row['Simple English'],
             "explanation": row['Explanation'],
             "unit": row['Unit'],
-            "status": status
+            "status": self.table.status(term, value)
         }
 
+    # Classify many reports at once: a DataFrame (one row per report, one
+    # column per test) or a dict; returns LOW / NORMAL / HIGH per cell.
+    def analyze_many(self, values):
+        return self.table.classify(values)
+
 # ==========================================
 # 3. PDF EXTRACTION
 # ==========================================
-def scan_pdf(pdf_path, tests_to_find):
+SYNONYMS = {
+    "Glucose (Fasting)": ["BLOOD SUGAR FASTING", "FASTING BLOOD SUGAR", "Glucose-F"],
+    "Hemoglobin": ["HAEMOGLOBIN", "HB", "Hemoglobin"],
+    "RBC Count": ["RED BLOOD CELL COUNT", "RBC"],
+    "Hematocrit (PCV)": ["PACKED CELL VOLUME", "HCT", "PCV"],
+    "MCV": ["MCV", "Mean Corpuscular Volume"],
+    "MCH": ["MCH", "Mean Corpuscular Hb"],
+    "MCHC": ["MCHC", "Mean Corpuscular Hb Concn"],
+    "RDW": ["RDW CV", "Red Cell Distribution Width"],
+    "Total WBC": ["TOTAL WBC COUNT", "Total Leucocyte Count", "TLC"],
+    "Neutrophils": ["Absolute Neutrophils Count", "Neutrophils"],
+    "Lymphocytes": ["Absolute Lymphocyte count", "Lymphocytes"],
+    "Monocytes": ["Absolute Monocyte Count", "Monocytes"],
+    "Eosinophils": ["Absolute Eosinophil count", "Eosinophils"],
+    "Basophils": ["Absolute Basophil count", "Basophils"],
+    "BUN": ["BLOOD UREA NITROGEN", "BUN"],
+    "Creatinine": ["CREATININE", "S.Creatinine"],
+    "Blood Urea": ["BLOOD UREA"],
+    "Calcium": ["CALCIUM"],
+    "Phosphorus": ["PHOSPHORUS"],
+    "Uric Acid": ["URIC ACID"],
+    "Total Cholesterol": ["CHOLESTEROL", "Total Cholesterol"],
+    "Triglycerides": ["TRIGLYCERIDE", "Triglycerides"],
+    "HDL Cholesterol": ["HDL-CHOLESTEROL", "HDL"],
+    "VLDL Cholesterol": ["VLDL-CHOLESTEROL"],
+    "LDL Cholesterol": ["LDL-CHOLESTEROL"],
+    "Chol/HDL Ratio": ["CHOLESTEROL/HDL RATIO"],
+    "Total Bilirubin": ["BILIRUBIN-TOTAL"],
+    "Direct Bilirubin": ["BILIRUBIN-DIRECT"],
+    "Indirect Bilirubin": ["BILIRUBIN-INDIRECT"],
+    "Total Protein": ["PROTEIN TOTAL"],
+    "Albumin": ["ALBUMIN"],
+    "Globulin": ["GLOBULIN"],
+    "A/G Ratio": ["ALBUMIN GLOBULIN RATIO", "A/G Ratio"],
+    "SGOT (AST)": ["ASPARTATE AMINO TRANSFERASE", "SGOT", "AST"],
+    "SGPT (ALT)": ["ALANINE AMINOTRANSFERASE", "SGPT", "ALT"],
+    "GGT": ["GAMMA GLUTAMYL TRANSFERASE", "GGT"],
+    "Alkaline Phosphatase": ["ALKALINE PHOSPHATASE", "ALP"]
+}
+
+# Compiled once per test list; the default catalog is warmed at import
+@lru_cache(maxsize=32)
+def get_matcher(tests):
+    return AliasMatcher({t: SYNONYMS.get(t, [t]) for t in tests})
+
+get_matcher(tuple(SYNONYMS))
+
+def normalize_text(text):
+    return re.sub(r'\s+', ' ', text)
+
+# Per-vendor layout templates (lab_templates.py), learned from full scans;
+# opt-in: only used when SMARTLAB_TEMPLATES names the file that keeps them
+layout_templates = LayoutTemplates(os.environ["SMARTLAB_TEMPLATES"]) \
+    if os.environ.get("SMARTLAB_TEMPLATES") else None
+
+# With SMARTLAB_TEMPLATES set, known vendors are read from their template's
+# regions; tokenized mode always scans the full text.
+# tokenized=True matches whole-word aliases and looks for the value in a
+# bounded window of tokens; lazy=True extracts page by page and stops once
+# every test has a value; workers > 1 (0 = all CPUs) extracts large reports
+# on a process pool. `backend` is "auto", "pdftotext" or "pdfplumber".
+# Pass a dict as `stats` to get token / page counts and timings. max_rss_mb
+# caps the process's memory in every pass over the PDF (template, lazy or
+# full; see pdf_extract); past it the scan raises MemoryLimitExceeded instead of returning partial values.
+# Other errors are printed and give {} unless raise_errors=True (batch mode).
+# `source` may be a path, bytes / memoryview or a binary file-like object.
+def scan_pdf(source, tests_to_find, tokenized=False, lazy=False, workers=1,
+             backend="auto", stats=None, max_rss_mb=None, raise_errors=False):
     extracted = {}
-    full_text = ""
     
-    synonyms = {
-        "Glucose (Fasting)": ["BLOOD SUGAR FASTING", "FASTING BLOOD SUGAR", "Glucose-F"],
-        "Hemoglobin": ["HAEMOGLOBIN", "HB", "Hemoglobin"],
-        "RBC Count": ["RED BLOOD CELL COUNT", "RBC"],
-        "Hematocrit (PCV)": ["PACKED CELL VOLUME", "HCT", "PCV"],
-        "MCV": ["MCV", "Mean Corpuscular Volume"],
-        "MCH": ["MCH", "Mean Corpuscular Hb"],
-        "MCHC": ["MCHC", "Mean Corpuscular Hb Concn"],
-        "RDW": ["RDW CV", "Red Cell Distribution Width"],
-        "Total WBC": ["TOTAL WBC COUNT", "Total Leucocyte Count", "TLC"],
-        "Neutrophils": ["Absolute Neutrophils Count", "Neutrophils"],
-        "Lymphocytes": ["Absolute Lymphocyte count", "Lymphocytes"],
-        "Monocytes": ["Absolute Monocyte Count", "Monocytes"],
-        "Eosinophils": ["Absolute Eosinophil count", "Eosinophils"],
-        "Basophils": ["Absolute Basophil count", "Basophils"],
-        "BUN": ["BLOOD UREA NITROGEN", "BUN"],
-        "Creatinine": ["CREATININE", "S.Creatinine"],
-        "Blood Urea": ["BLOOD UREA"],
-        "Calcium": ["CALCIUM"],
-        "Phosphorus": ["PHOSPHORUS"],
-        "Uric Acid": ["URIC ACID"],
-        "Total Cholesterol": ["CHOLESTEROL", "Total Cholesterol"],
-        "Triglycerides": ["TRIGLYCERIDE", "Triglycerides"],
-        "HDL Cholesterol": ["HDL-CHOLESTEROL", "HDL"],
-        "VLDL Cholesterol": ["VLDL-CHOLESTEROL"],
-        "LDL Cholesterol": ["LDL-CHOLESTEROL"],
-        "Chol/HDL Ratio": ["CHOLESTEROL/HDL RATIO"],
-        "Total Bilirubin": ["BILIRUBIN-TOTAL"],
-        "Direct Bilirubin": ["BILIRUBIN-DIRECT"],
-        "Indirect Bilirubin": ["BILIRUBIN-INDIRECT"],
-        "Total Protein": ["PROTEIN TOTAL"],
-        "Albumin": ["ALBUMIN"],
-        "Globulin": ["GLOBULIN"],
-        "A/G Ratio": ["ALBUMIN GLOBULIN RATIO", "A/G Ratio"],
-        "SGOT (AST)": ["ASPARTATE AMINO TRANSFERASE", "SGOT", "AST"],
-        "SGPT (ALT)": ["ALANINE AMINOTRANSFERASE", "SGPT", "ALT"],
-        "GGT": ["GAMMA GLUTAMYL TRANSFERASE", "GGT"],
-        "Alkaline Phosphatase": ["ALKALINE PHOSPHATASE", "ALP"]
-    }
-
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                full_text += page.extract_text() + "\n"
+        matcher = get_matcher(tuple(tests_to_find))
+        source = rereadable(source)
+
+        templates = layout_templates if not tokenized else None
+        if templates is not None:
+            found = templates.extract(source, matcher, normalize_text, stats=stats,
+                                      max_rss_mb=max_rss_mb)
+            if found is not None:
+                if stats is not None:
+                    stats["template"] = True
+                return found
+
+        if lazy:
+            with open_pdf(source) as pdf:
+                extracted = scan_pages(pdf, matcher, normalize_text, tokenized=tokenized,
+                                       stats=stats, max_rss_mb=max_rss_mb)
+            if templates is not None:
+                templates.learn(source, extracted, matcher, normalize_text, stats=stats,
+                                max_rss_mb=max_rss_mb)
+            return extracted
+
+        full_text = "".join(page_text + "\n" for page_text in page_texts(
+            source, backend, workers=workers, stats=stats, max_rss_mb=max_rss_mb))
         
-        full_text = re.sub(r'\s+', ' ', full_text)
-
-        for test_name in tests_to_find:
-            aliases = synonyms.get(test_name, [test_name])
-            for alias in aliases:
-                pattern = re.compile(re.escape(alias) + r".*?(\d+\.?\d*)", re.IGNORECASE)
-                match = pattern.search(full_text)
-                if match:
-                    try:
-                        extracted[test_name] = float(match.group(1))
-                        break 
-                    except:
-                        pass
+        start = time.perf_counter()
+        full_text = normalize_text(full_text)
+
+        if tokenized:
+            extracted = matcher.find_tokens(full_text, stats=stats)
+        else:
+            extracted = matcher.find(full_text)
+        seconds = time.perf_counter() - start
+        observe("match", seconds)
+        if stats is not None:
+            stats["match_seconds"] = seconds
+        if templates is not None:
+            templates.learn(source, extracted, matcher, normalize_text, stats=stats,
+                            max_rss_mb=max_rss_mb)
+    except MemoryLimitExceeded:
+        raise
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Error: {e}")
         
     return extracted
 
+# A PDF holding several patients' reports back to back: yields one
+# extracted-and-analyzed dict per report (see pdf_extract.split_reports)
+# as soon as its pages have been read, so only one report's text is held.
+def scan_bundle(source, interpreter, tokenized=False, stats=None, max_rss_mb=None):
+    matcher = get_matcher(tuple(interpreter.get_known_tests()))
+    for patient, first_page, texts in split_reports(source, stats=stats, max_rss_mb=max_rss_mb):
+        with stage("match"):
+            text = normalize_text("\n".join(texts) + "\n")
+            values = matcher.find_tokens(text) if tokenized else matcher.find(text)
+        results = []
+        with stage("analyze"):
+            for term, value in values.items():
+                res = interpreter.analyze(term, value)
+                if res:
+                    results.append(dict(res, test=term, value=value))
+        yield {"patient": patient, "first_page": first_page + 1, "pages": len(texts),
+               "values": values, "results": results}
+
+# ==========================================
+# 4. BATCH MODE
+# ==========================================
+# python backend.py reports/ "archive/**/*.pdf" --from-file list.txt -o out.jsonl
+# Reports are scanned on a process pool and written as JSON lines the moment
+# each one finishes; only a bounded number of reports is in flight at a time.
+# With --resume, paths that already have a successful "report" line in the
+# output file are skipped (failed ones are retried), so an interrupted back-load can simply be restarted. With
+# --split each input is a multi-patient bundle and its report line carries
+# one entry per patient under "patients".
+_worker_interpreter = None
+
+def iter_inputs(patterns, list_file=None):
+    def expand(item):
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(".pdf"):
+                        yield os.path.join(root, name)
+        elif any(c in item for c in "*?["):
+            yield from sorted(glob.iglob(item, recursive=True))
+        else:
+            yield item
+
+    def read_list():
+        if list_file == "-":
+            yield from (line.strip() for line in sys.stdin)
+            return
+        with open(list_file, encoding="utf-8") as f:
+            yield from (line.strip() for line in f)
+
+    seen = set()
+    sources = [patterns, read_list()] if list_file else [patterns]
+    for source in sources:
+        for item in source:
+            if not item:
+                continue
+            for path in expand(item):
+                if path not in seen:
+                    seen.add(path)
+                    yield path
+
+def completed_inputs(output_path):
+    done = set()
+    if not output_path or not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # torn last line from an interrupted run
+            if entry.get("type") == "report" and "error" not in entry:
+                done.add(entry["path"])
+    return done
+
+def open_output(output_path, resume):
+    if not output_path:
+        return sys.stdout
+    if not resume:
+        return open(output_path, "w", encoding="utf-8")
+    out = open(output_path, "a+", encoding="utf-8")
+    # Terminate a torn last line so the next record starts cleanly
+    if out.tell() > 0:
+        out.seek(out.tell() - 1)
+        if out.read(1) != "\n":
+            out.write("\n")
+    return out
+
+def analyze_file(path, tokenized=False, lazy=False, backend="auto", split=False,
+                 max_rss_mb=None):
+    global _worker_interpreter
+    if _worker_interpreter is None:
+        _worker_interpreter = MedicalInterpreter()
+
+    report = {"type": "report", "path": path, "values": {}, "results": []}
+    # Runs in a worker process: stage timings travel back with the report
+    # and are recorded by the parent (see run_batch)
+    stats = {}
+    start = time.perf_counter()
+    try:
+        if split:
+            report["patients"] = list(scan_bundle(path, _worker_interpreter, tokenized,
+                                                  stats=stats, max_rss_mb=max_rss_mb))
+        else:
+            # scan_pdf prints its errors; keep them out of a JSONL stdout
+            with redirect_stdout(sys.stderr):
+                report["values"] = scan_pdf(path, _worker_interpreter.get_known_tests(),
+                                            tokenized=tokenized, lazy=lazy, backend=backend,
+                                            stats=stats, max_rss_mb=max_rss_mb,
+                                            raise_errors=True)
+            analyzed = time.perf_counter()
+            for term, value in report["values"].items():
+                res = _worker_interpreter.analyze(term, value)
+                if res:
+                    report["results"].append(dict(res, test=term, value=value))
+            stats["analyze_seconds"] = time.perf_counter() - analyzed
+    except Exception as e:
+        report["error"] = str(e)
+    stats["report_seconds"] = time.perf_counter() - start
+    if stats.get("peak_rss_mb") is not None:
+        report["peak_rss_mb"] = round(stats["peak_rss_mb"], 1)
+    report["timings"] = {name[:-len("_seconds")]: stats[name] for name in
+                         ("extract_seconds", "match_seconds", "analyze_seconds", "report_seconds")
+                         if name in stats}
+    return report
+
+def format_report(report, per_test=False):
+    # The report line goes last: it marks the input as done for --resume
+    lines = []
+    if per_test:
+        for res in report["results"]:
+            lines.append(json.dumps(dict(res, type="test", path=report["path"])))
+        for patient in report.get("patients", ()):
+            for res in patient["results"]:
+                lines.append(json.dumps(dict(res, type="test", path=report["path"],
+                                             patient=patient["patient"],
+                                             first_page=patient["first_page"])))
+    lines.append(json.dumps(report))
+    return "\n".join(lines) + "\n"
+
+def run_batch(argv):
+    parser = argparse.ArgumentParser(description="SmartLab AI batch scanner")
+    parser.add_argument("inputs", nargs="*", help="PDF files, directories or glob patterns")
+    parser.add_argument("--from-file", help="file with one input per line ('-' for stdin)")
+    parser.add_argument("-o", "--output", help="JSONL output file (default: stdout)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--per-test", action="store_true", help="also write one line per test")
+    parser.add_argument("--resume", action="store_true", help="skip inputs already in --output")
+    parser.add_argument("--tokenized", action="store_true")
+    parser.add_argument("--lazy", action="store_true")
+    parser.add_argument("--split", action="store_true",
+                        help="inputs are multi-patient bundles: one result per patient")
+    parser.add_argument("--backend", default="auto", choices=["auto", "pdftotext", "pdfplumber"])
+    parser.add_argument("--max-rss-mb", type=float,
+                        help="per-worker memory ceiling; larger reports fail instead of "
+                             "getting the worker killed (default: SMARTLAB_MAX_RSS_MB)")
+    parser.add_argument("--metrics", help="write per-stage timings here (Prometheus text format)")
+    args = parser.parse_args(argv)
+
+    done = completed_inputs(args.output) if args.resume else set()
+    inputs = (p for p in iter_inputs(args.inputs, args.from_file) if p not in done)
+    out = open_output(args.output, args.resume)
+
+    counts = {"written": 0, "failed": 0}
+    def emit(future):
+        report = future.result()
+        for stage_name, seconds in report.pop("timings", {}).items():
+            observe(stage_name, seconds)
+        inc("reports")
+        inc("reports_failed", "error" in report)
+        out.write(format_report(report, args.per_test))
+        out.flush()
+        counts["written"] += 1
+        counts["failed"] += "error" in report
+
+    workers = max(1, args.workers)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for path in inputs:
+                pending.add(pool.submit(analyze_file, path, args.tokenized, args.lazy,
+                                        args.backend, args.split, args.max_rss_mb))
+                if len(pending) >= workers * 4:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        emit(future)
+            for future in as_completed(pending):
+                emit(future)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"Scanned {counts['written']} reports ({counts['failed']} failed, "
+          f"{len(done)} skipped)", file=sys.stderr)
+    if args.metrics:
+        with open(args.metrics, "w") as f:
+            f.write(REGISTRY.prometheus())
+    return 1 if counts["failed"] else 0
+
 # ==========================================
-# 4. MAIN TERMINAL APP
+# 5. MAIN TERMINAL APP
 # ==========================================
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_batch(sys.argv[1:]))
+
     interpreter = MedicalInterpreter()
     
     # 1. Get PDF Path (Hardcoded for testing or Input)
@@ -206,8 +465,10 @@ if __name__ == "__main__":
         print("No medical data found in PDF.")
     
     # 3. Analyze and Print in Requested Format
-    for term, value in extracted_values.items():
-        res = interpreter.analyze(term, value)
+    with stage("analyze"):
+        analyzed = [(term, value, interpreter.analyze(term, value))
+                    for term, value in extracted_values.items()]
+    for term, value, res in analyzed:
         if res:
             # Exact format from your request
             print(f"{term} → \"{res['simple_name']}\"")
@@ -0,0 +1,380 @@
+import argparse
+import ast
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+# ------------------------------------------------------------
+# BENCHMARK SUITE
+# ------------------------------------------------------------
+# python benchmarks/run.py [--quick] [-o results.json] [--save-baseline | --against REF]
+#
+# Times, separately, PDF text extraction (per backend), alias matching,
+# backend.scan_pdf served by a layout template (lab_templates.py, learned by
+# scan_pdf itself from the first scans of the same report), multi-patient bundle splitting and analysis for the backend.py and final.py pipelines on synthetic reports
+# (see synth_pdf.py), and application.py's reminder queries at 10k / 100k /
+# 1M Record rows. Results are written as JSON. Timings are the best of
+# --repeat runs.
+#
+# Absolute times only compare on the same machine, so there are two
+# baselines. --against REF checks REF out into a git worktree and runs its
+# suite with the same options right after this one, on this runner (use
+# this in CI). Without it, benchmarks/baseline.json is used; it is written
+# by --save-baseline on the machine that compares against it and is not
+# committed. A baseline recorded on another machine (platform, CPU model,
+# CPU count or Python differ) is reported but never fails the run. A timing
+# more than --threshold slower is a regression and the run exits 1, but only
+# when both runs used at least MIN_GATE_REPEAT repeats.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+BASELINE = os.path.join(HERE, "baseline.json")
+
+# Keep the apps' import-time database setup away from the real database
+WORKDIR = tempfile.mkdtemp(prefix="health-bench-")
+os.environ["HEALTH_DB_URL"] = "sqlite:///" + os.path.join(WORKDIR, "bench.db")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+from synth_pdf import lab_bundle, lab_report  # noqa: E402
+
+# name -> (result pages, noise pages, layout, alias rate)
+CORPUS = {
+    "small": (1, 0, "table", 0.0),
+    "medium": (2, 3, "inline", 0.5),
+    "large": (4, 36, "mixed", 0.8),
+}
+QUICK_CORPUS = ("small", "medium")
+BUNDLE_PATIENTS = 6
+ROW_COUNTS = (10_000, 100_000, 1_000_000)
+QUICK_ROW_COUNTS = (10_000,)
+DUE_BATCH = 100
+MIN_GATE_REPEAT = 3
+
+
+def timed(fn, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return {"min_ms": min(times), "median_ms": statistics.median(times), "runs": repeat}, result
+
+
+# ---------- pipelines ----------
+FINAL_NAMES = {"LAB_DATA", "TEST_SYNONYMS", "get_lab_reference", "get_test_matcher",
+               "normalize_text", "scan_pdf", "MedicalInterpreter", "analyze_report"}
+
+
+def load_final():
+    # final.py is a Streamlit script: run its imports and the lab pipeline
+    # definitions only, not the UI, page setup or database
+    path = os.path.join(ROOT, "final.py")
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    keep = [node for node in tree.body
+            if isinstance(node, (ast.Import, ast.ImportFrom))
+            or isinstance(node, (ast.FunctionDef, ast.ClassDef)) and node.name in FINAL_NAMES
+            or isinstance(node, ast.Assign) and any(getattr(t, "id", None) in FINAL_NAMES
+                                                    for t in node.targets)]
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    namespace = {"__name__": "final_pipeline", "__file__": path}
+    exec(compile(ast.Module(body=keep, type_ignores=[]), path, "exec"), namespace)
+    return namespace
+
+
+def build_catalog(backend, final):
+    # Every test either app knows, with all aliases and a reference range
+    catalog = {}
+    for data, synonyms in ((backend.LAB_DATA, backend.SYNONYMS),
+                           (final["LAB_DATA"], final["TEST_SYNONYMS"])):
+        for term, unit, low, high in zip(data["Medical Term"], data["Unit"], data["Min"], data["Max"]):
+            spec = catalog.setdefault(term, {"aliases": [], "unit": unit, "min": low, "max": high})
+            for alias in synonyms.get(term, []):
+                if alias not in spec["aliases"] and alias != term:
+                    spec["aliases"].append(alias)
+    return catalog
+
+
+def recall(found, expected, known):
+    # Of the written tests this app knows, how many it found with the right value
+    known = [test for test in expected if test in known]
+    correct = [test for test in known if test in found and float(found[test]) == expected[test]]
+    return {"correct": len(correct), "known": len(known)}
+
+
+def bench_pipelines(corpus, backends, repeat, results, checks):
+    os.chdir(WORKDIR)  # reference CSVs / compiled tables are written here
+    import backend
+    from lab_templates import LEARN_AFTER, LayoutTemplates
+    from pdf_extract import page_texts
+
+    final = load_final()
+    catalog = build_catalog(backend, final)
+
+    backend_interpreter = backend.MedicalInterpreter()
+    backend_tests = tuple(backend_interpreter.get_known_tests())
+    final_matcher = final["get_test_matcher"]()
+
+    for name in corpus:
+        result_pages, noise_pages, layout, alias_rate = CORPUS[name]
+        pdf, expected = lab_report(catalog, seed=len(name), result_pages=result_pages,
+                                   noise_pages=noise_pages, layout=layout, alias_rate=alias_rate)
+        path = os.path.join(WORKDIR, f"{name}.pdf")
+        with open(path, "wb") as f:
+            f.write(pdf)
+
+        texts = None
+        for engine in backends:
+            results[f"extract.{engine}.{name}"], pages = timed(
+                lambda: list(page_texts(path, engine)), repeat)
+            texts = texts or pages
+
+        # backend.py: "\n"-joined, whitespace-collapsed, case-insensitive aliases
+        matcher = backend.get_matcher(backend_tests)
+        results[f"backend.match.{name}"], found = timed(
+            lambda: matcher.find(backend.normalize_text("\n".join(texts) + "\n")), repeat)
+        results[f"backend.analyze.{name}"], _ = timed(
+            lambda: [backend_interpreter.analyze(term, value) for term, value in found.items()], repeat)
+        checks[f"backend.{name}"] = recall(found, expected, backend_tests)
+
+        # The app's own scan_pdf, once its first LEARN_AFTER scans of this
+        # vendor have learned a template
+        templates = backend.layout_templates = LayoutTemplates()
+        try:
+            for _ in range(LEARN_AFTER):
+                backend.scan_pdf(path, backend_tests)
+            results[f"template.scan.{name}"], from_template = timed(
+                lambda: backend.scan_pdf(path, backend_tests), repeat)
+        finally:
+            backend.layout_templates = None
+        checks[f"template.{name}"] = recall(from_template, expected, backend_tests)
+        checks[f"template.hits.{name}"] = {"correct": templates.stats["hits"], "known": repeat,
+                                           "what": "scans served by the template"}
+
+        # final.py: upper-cased text, case-sensitive aliases, 40-char window
+        results[f"final.match.{name}"], found = timed(
+            lambda: final_matcher.find(final["normalize_text"](" ".join(texts) + " ")), repeat)
+        results[f"final.analyze.{name}"], _ = timed(lambda: final["analyze_report"](found), repeat)
+        checks[f"final.{name}"] = recall(found, expected, final["TEST_SYNONYMS"])
+
+    # Multi-patient bundles: split while reading, one result per patient;
+    # unnumbered, numbered per report and numbered across the bundle
+    for numbering in (None, "report", "bundle"):
+        key = "backend.bundle" + (f".{numbering}_numbers" if numbering else "")
+        pdf, reports = lab_bundle(catalog, patients=BUNDLE_PATIENTS, result_pages=1,
+                                  noise_pages=1, layout="mixed", numbering=numbering)
+        results[key], found = timed(lambda: list(backend.scan_bundle(pdf, backend_interpreter)),
+                                    repeat)
+        checks[key] = {
+            "correct": sum(report["first_page"] == first + 1
+                           for report, (first, _) in zip(found, reports))
+                       if len(found) == len(reports) else 0,
+            "known": len(reports), "what": "reports split at the right page"}
+
+
+# ---------- reminders ----------
+def insert_records(db_path, start, count, now):
+    # ~1% due (past, Pending), ~9% already Reminded, the rest in the future
+    def rows():
+        for i in range(start, start + count):
+            bucket = i % 100
+            if bucket == 0:
+                when, status = now - timedelta(minutes=i % 997 + 1), "Pending"
+            elif bucket < 10:
+                when, status = now - timedelta(days=i % 365 + 1), "Reminded"
+            else:
+                when, status = now + timedelta(minutes=i % 500_000 + 1), "Pending"
+            yield ("Medicine", f"dose {i}", when.strftime("%Y-%m-%d %H:%M:%S.%f"), status)
+
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO record (category, name, scheduled_time, status) VALUES (?, ?, ?, ?)", rows())
+
+
+def bench_reminders(row_counts, repeat, results):
+    import application
+
+    db_path = os.path.join(WORKDIR, "bench.db")
+    with application.app.app_context():
+        application.db.create_all()
+        application.migrate(application.db.engine, "record", application.RECORD_MIGRATIONS)
+    client = application.app.test_client()
+    now = datetime.now()
+
+    total = 0
+    for count in sorted(row_counts):
+        insert_records(db_path, total, count - total, now)
+        total = count
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("ANALYZE")
+            due = [row[0] for row in conn.execute(
+                "SELECT id FROM record WHERE status = 'Pending' AND scheduled_time <= ? "
+                "ORDER BY scheduled_time LIMIT ?",
+                (now.strftime("%Y-%m-%d %H:%M:%S.%f"), DUE_BATCH * repeat))]
+
+        results[f"reminders.load_pending.{count}"], _ = timed(application.load_pending, repeat)
+
+        batches = iter([due[i:i + DUE_BATCH] for i in range(0, len(due), DUE_BATCH)])
+
+        def check_batch():
+            with redirect_stdout(io.StringIO()):  # one NOTIFICATION line per reminder
+                application.check_reminders(next(batches, []))
+        results[f"reminders.check_reminders.{count}"], _ = timed(check_batch, repeat)
+        results[f"reminders.index_page.{count}"], _ = timed(lambda: client.get("/"), repeat)
+
+
+# ---------- baseline ----------
+def compare(results, baseline, threshold, floor_ms):
+    # Slower than baseline by more than threshold (and by at least floor_ms)
+    regressions = []
+    for key, base in sorted(baseline.get("results", {}).items()):
+        current = results.get(key)
+        if current is None:
+            continue
+        before, after = base["min_ms"], current["min_ms"]
+        if after > before * (1 + threshold) and after - before >= floor_ms:
+            regressions.append((key, before, after))
+    return regressions
+
+
+def machine():
+    # What absolute timings depend on; baselines only gate on an exact match
+    cpu = platform.processor() or None
+    try:
+        with open("/proc/cpuinfo") as f:
+            cpu = next((line.split(":", 1)[1].strip() for line in f
+                        if line.startswith("model name")), cpu)
+    except OSError:
+        pass
+    return {"platform": platform.platform(), "cpu": cpu, "cpus": os.cpu_count(),
+            "python": platform.python_version()}
+
+
+def run_against(ref, args):
+    # Runs REF's own suite with the same options on this machine; its results
+    # are the baseline
+    tmp = tempfile.mkdtemp(prefix="health-bench-ref-")
+    tree = os.path.join(tmp, "tree")
+    output = os.path.join(tmp, "results.json")
+    subprocess.run(["git", "worktree", "add", "--detach", tree, ref], cwd=ROOT, check=True,
+                   capture_output=True)
+    try:
+        command = [sys.executable, os.path.join(tree, "benchmarks", "run.py"),
+                   "--repeat", str(args.repeat), "-o", output,
+                   "--baseline", os.path.join(tmp, "none.json")]
+        command += ["--quick"] if args.quick else []
+        command += ["--rows", *map(str, args.rows)] if args.rows else []
+        command += ["--skip-pdf"] if args.skip_pdf else []
+        command += ["--skip-reminders"] if args.skip_reminders else []
+        print(f"running the suite at {ref} ...")
+        subprocess.run(command, cwd=tree, check=True, stdout=subprocess.DEVNULL)
+        with open(output) as f:
+            return json.load(f)
+    finally:
+        subprocess.run(["git", "worktree", "remove", "--force", tree], cwd=ROOT,
+                       capture_output=True)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the lab-report and reminder pipelines.")
+    parser.add_argument("--quick", action="store_true", help="small corpus, 10k rows only")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--rows", type=int, nargs="+", help="Record row counts to test")
+    parser.add_argument("--skip-pdf", action="store_true")
+    parser.add_argument("--skip-reminders", action="store_true")
+    parser.add_argument("-o", "--output", default=os.path.join(HERE, "results.json"))
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write results as the new baseline")
+    parser.add_argument("--against", metavar="REF",
+                        help="compare with REF's suite, run now on this machine (e.g. origin/main)")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--floor-ms", type=float, default=1.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    backends = ["pdfplumber"] + (["pdftotext"] if shutil.which("pdftotext") else [])
+    results, checks = {}, {}
+    try:
+        if not args.skip_pdf:
+            bench_pipelines(QUICK_CORPUS if args.quick else CORPUS, backends, args.repeat,
+                            results, checks)
+        if not args.skip_reminders:
+            rows = args.rows or (QUICK_ROW_COUNTS if args.quick else ROW_COUNTS)
+            bench_reminders(rows, args.repeat, results)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": machine(),
+            "backends": backends,
+            "repeat": args.repeat,
+        },
+        "checks": checks,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    for key, timing in sorted(results.items()):
+        print(f"{key:45} {timing['min_ms']:10.2f} ms  (median {timing['median_ms']:.2f})")
+    for key, check in sorted(checks.items()):
+        print(f"{key:45} {check['correct']} / {check['known']} "
+              f"{check.get('what', 'known tests read correctly')}")
+
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    if args.against:
+        baseline = run_against(args.against, args)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    else:
+        print("no baseline to compare with (run with --save-baseline or --against REF)")
+        return 0
+
+    gate = True
+    if not args.against and baseline.get("meta", {}).get("machine") != report["meta"]["machine"]:
+        print("baseline was recorded on another machine: slowdowns are not failures "
+              "(use --against REF, or --save-baseline here)")
+        gate = False
+    if min(args.repeat, baseline.get("meta", {}).get("repeat", 0)) < MIN_GATE_REPEAT:
+        print(f"fewer than {MIN_GATE_REPEAT} repeats: slowdowns are not failures")
+        gate = False
+
+    regressions = compare(results, baseline, args.threshold, args.floor_ms)
+    label = "REGRESSION" if gate else "slower"
+    for key, before, after in regressions:
+        print(f"{label} {key}: {before:.2f} ms -> {after:.2f} ms ({after / before - 1:+.0%})")
+    return 1 if gate and regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
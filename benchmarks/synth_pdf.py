@@ -0,0 +1,166 @@
+import io
+import random
+import sys
+
+# ------------------------------------------------------------
+# SYNTHETIC LAB REPORTS
+# ------------------------------------------------------------
+# Writes text-only PDFs by hand (no reportlab): one uncompressed content
+# stream per page in the standard Helvetica font, which pdfplumber and
+# pdftotext both read. Reports mix the canonical test names with their
+# aliases, lay results out as a table, inline or "name: value", and can be
+# padded with noise pages full of words and numbers, like the boilerplate
+# pages of real lab reports.
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+LINE_HEIGHT = 14
+TOP, BOTTOM = 800, 50
+LAYOUTS = ("table", "inline", "colon")
+
+NOISE_WORDS = (
+    "sample collected processed method reference interval patient physician "
+    "laboratory accredited report result note fasting clinical correlation "
+    "advised specimen serum plasma whole blood analyzer calibrated verified "
+    "page authorised signatory department pathology biochemistry haematology"
+).split()
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(pages):
+    # pages: [[(x, y, font_size, text), ...], ...] -> PDF bytes
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+
+    def add(body):
+        offsets.append(out.tell())
+        out.write(f"{len(offsets)} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    # 1 catalog, 2 page tree, 3 font, then (page, content) pairs
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages)))
+    add(b"<< /Type /Catalog /Pages 2 0 R >>")
+    add(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    for i, items in enumerate(pages):
+        add(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode())
+        stream = "".join(
+            f"BT /F1 {size} Tf 1 0 0 1 {x} {y} Tm ({_escape(text)}) Tj ET\n"
+            for x, y, size, text in items
+        ).encode("latin-1")
+        add(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"endstream")
+
+    xref = out.tell()
+    out.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\n"
+              f"startxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def _paginate(lines):
+    # lines: [[(x, size, text), ...], ...] -> pages of positioned items
+    pages, items, y = [], [], TOP
+    for line in lines:
+        if y < BOTTOM:
+            pages.append(items)
+            items, y = [], TOP
+        items.extend((x, y, size, text) for x, size, text in line)
+        y -= LINE_HEIGHT
+    pages.append(items)
+    return pages
+
+
+def _result_line(layout, name, value, unit, low, high):
+    reference = f"{low:g} - {high:g}"
+    if layout == "table":
+        return [(50, 10, name), (260, 10, value), (330, 10, unit), (420, 10, reference)]
+    if layout == "inline":
+        return [(50, 10, f"{name} {value} {unit} ({reference})")]
+    return [(50, 10, f"{name}: {value} {unit}   Ref: {reference}")]
+
+
+def _noise_lines(rng, count):
+    lines = []
+    for _ in range(count):
+        words = [str(rng.randint(1, 999)) if rng.random() < 0.15 else rng.choice(NOISE_WORDS)
+                 for _ in range(rng.randint(6, 14))]
+        lines.append([(50, 9, " ".join(words).capitalize())])
+    return lines
+
+
+def report_pages(catalog, seed=0, result_pages=1, noise_pages=0, layout="table",
+                 alias_rate=0.5, coverage=1.0):
+    # catalog: {test: {"aliases": [...], "unit": str, "min": float, "max": float}}
+    # Returns (pages, {test: value written}). Each result page lists the
+    # covered tests once, under a random alias with probability alias_rate.
+    rng = random.Random(seed)
+    tests = [t for t in catalog if rng.random() < coverage]
+    layouts = LAYOUTS if layout == "mixed" else (layout,)
+    lines_per_page = (TOP - BOTTOM) // LINE_HEIGHT + 1
+
+    lines, expected = [], {}
+    for page in range(result_pages):
+        page_lines = [
+            [(50, 14, "CITY DIAGNOSTIC LABORATORY")],
+            [(50, 10, f"Patient: TEST PATIENT {seed}"), (330, 10, f"Report ID: {seed:06d}-{page}")],
+            [(50, 10, "Test"), (260, 10, "Result"), (330, 10, "Unit"), (420, 10, "Reference")],
+        ]
+        for test in tests:
+            spec = catalog[test]
+            aliases = spec["aliases"]
+            name = rng.choice(aliases) if aliases and rng.random() < alias_rate else test
+            low, high = spec["min"], spec["max"]
+            value = round(rng.uniform(low * 0.7, high * 1.3 if high else 1.0), 2)
+            expected.setdefault(test, value)
+            page_lines.append(_result_line(rng.choice(layouts), name, str(value),
+                                           spec["unit"], low, high))
+        page_lines += _noise_lines(rng, max(0, lines_per_page - len(page_lines)))
+        lines += page_lines[:lines_per_page]
+    lines += _noise_lines(rng, noise_pages * lines_per_page)
+
+    return _paginate(lines), expected
+
+
+def lab_report(catalog, seed=0, **options):
+    # (pdf bytes, {test: value written}); options as for report_pages
+    pages, expected = report_pages(catalog, seed, **options)
+    return write_pdf(pages), expected
+
+
+def _number(pages):
+    # A "Page i of N" footer on every page
+    return [items + [(50, 30, 8, f"Page {i} of {len(pages)}")]
+            for i, items in enumerate(pages, 1)]
+
+
+def lab_bundle(catalog, patients=10, seed=0, numbering=None, **options):
+    # Several patients' reports back to back in one PDF, like the bundles
+    # some labs send: (pdf bytes, [(first page, {test: value})] per patient).
+    # numbering: None, "report" (pages numbered within each report) or
+    # "bundle" (one "Page i of N" sequence across all patients)
+    pages, reports = [], []
+    for patient in range(patients):
+        patient_pages, expected = report_pages(catalog, seed + patient, **options)
+        if numbering == "report":
+            patient_pages = _number(patient_pages)
+        reports.append((len(pages), expected))
+        pages += patient_pages
+    if numbering == "bundle":
+        pages = _number(pages)
+    return write_pdf(pages), reports
+
+
+if __name__ == "__main__":
+    # python benchmarks/synth_pdf.py out.pdf [noise_pages]: a quick sample
+    demo = {
+        "Hemoglobin": {"aliases": ["HB", "HAEMOGLOBIN"], "unit": "g/dL", "min": 13, "max": 17},
+        "Platelets": {"aliases": ["PLATELET COUNT"], "unit": "cells/cumm", "min": 150000, "max": 450000},
+    }
+    pdf, _ = lab_report(demo, noise_pages=int(sys.argv[2]) if len(sys.argv) > 2 else 1)
+    with open(sys.argv[1] if len(sys.argv) > 1 else "sample_report.pdf", "wb") as f:
+        f.write(pdf)
@@ -0,0 +1,123 @@
+import sys
+from datetime import datetime
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+# ------------------------------------------------------------
+# SCHEMA MIGRATIONS
+# ------------------------------------------------------------
+# create_all() only creates missing tables, so indexes / columns added to a
+# model never reach an existing health_tracker.db. Each component keeps an
+# ordered list of (version, description, [sql, ...]) and calls migrate() at
+# startup; applied versions are recorded per component in schema_migrations,
+# so every step runs once per database. Steps should be idempotent
+# (IF NOT EXISTS) because a fresh create_all() may already have done them;
+# SQLite has no ADD COLUMN IF NOT EXISTS, so use add_column() for columns.
+# Several processes may start at once (replicas, both apps on one database):
+# a step's transaction starts by recording the step, which takes the write
+# lock, so a second process waits for the first one and then skips the step.
+
+def add_column(table, column, ddl):
+    # A step that runs ALTER TABLE ... ADD COLUMN only if the column is missing
+    def step(conn):
+        if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return step
+
+
+def migrate(engine, component, migrations):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            " component VARCHAR(50) NOT NULL,"
+            " version INTEGER NOT NULL,"
+            " description VARCHAR(200),"
+            " applied_at DATETIME,"
+            " PRIMARY KEY (component, version))"
+        ))
+        applied = {row[0] for row in conn.execute(
+            text("SELECT version FROM schema_migrations WHERE component = :c"), {"c": component}
+        )}
+
+    done = []
+    for version, description, statements in migrations:
+        if version in applied:
+            continue
+        # One transaction per step: a failed step leaves the earlier ones applied
+        with engine.begin() as conn:
+            try:
+                conn.execute(
+                    text("INSERT INTO schema_migrations VALUES (:c, :v, :d, :t)"),
+                    {"c": component, "v": version, "d": description, "t": datetime.utcnow()}
+                )
+            except IntegrityError:
+                continue  # applied by another process since we looked
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(text(statement))
+        done.append(version)
+    return done
+
+
+# ------------------------------------------------------------
+# QUERY PLAN CHECK
+# ------------------------------------------------------------
+# The hot queries of both front-ends and the index each one should use.
+# python db_migrations.py [health_tracker.db] prints the SQLite plan for
+# every query whose table exists and exits non-zero if one is not indexed.
+HOT_QUERIES = [
+    ("final: due reminders", "records", "ix_records_status_time",
+     "SELECT * FROM records WHERE status = 'Pending' AND scheduled_time <= :now "
+     "ORDER BY scheduled_time"),
+    ("final: user's reminders", "records", "ix_records_email_time",
+     "SELECT * FROM records WHERE email = :email AND repeat_minutes IS NULL "
+     "AND (scheduled_time, id) > (:now, 0) "
+     "ORDER BY scheduled_time, id LIMIT 21"),
+    ("final: claimable outbox", "outbox", "ix_outbox_status_id",
+     "SELECT id FROM outbox WHERE status = 'Queued' OR (status = 'Sending' AND lease_expires < :now) "
+     "ORDER BY id LIMIT 100"),
+    ("application: pending reminders", "record", "ix_record_status_time",
+     "SELECT max(scheduled_time, coalesce(lease_expires, scheduled_time)), id FROM record "
+     "WHERE status = 'Pending'"),
+    ("application: listing", "record", "ix_record_scheduled_time",
+     "SELECT * FROM record WHERE repeat_minutes IS NULL AND (scheduled_time, id) > (:now, 0) "
+     "ORDER BY scheduled_time, id LIMIT 51"),
+    ("application: recurring schedules", "record", "ix_record_schedules",
+     "SELECT * FROM record WHERE status = 'Pending' AND repeat_minutes IS NOT NULL"),
+    ("users: login", "users", "ix_users_username",
+     "SELECT * FROM users WHERE username = :username"),
+]
+
+
+def query_plan(engine, sql, params=None):
+    params = params or {"now": datetime.utcnow(), "email": "", "username": ""}
+    with engine.connect() as conn:
+        return [row[-1] for row in conn.execute(text("EXPLAIN QUERY PLAN " + sql), params)]
+
+
+def check_query_plans(engine, queries=HOT_QUERIES):
+    tables = set(inspect(engine).get_table_names())
+    results = []
+    for name, table, index, sql in queries:
+        if table not in tables:
+            continue
+        plan = query_plan(engine, sql)
+        ok = any(index in step for step in plan) and not any(
+            step.startswith("SCAN " + table) and "INDEX" not in step for step in plan
+        )
+        results.append((name, index, ok, plan))
+    return results
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "health_tracker.db"
+    failed = 0
+    for name, index, ok, plan in check_query_plans(create_engine(f"sqlite:///{path}")):
+        failed += not ok
+        print(f"{'OK ' if ok else 'BAD'} {name} (expects {index})")
+        for step in plan:
+            print(f"      {step}")
+    sys.exit(1 if failed else 0)
@@ -4,18 +4,49 @@
 # FINAL ALL-IN-ONE STREAMLIT APP
 # ============================================================
 
+import time
+_script_started = time.perf_counter()
+
 import streamlit as st
-import pandas as pd
-import os, re
+import json, os, re, sys
 from datetime import datetime, timezone
 import pytz
-import smtplib
 from email.message import EmailMessage
-import pdfplumber
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Index, tuple_
 from sqlalchemy.orm import declarative_base, sessionmaker
-from streamlit_autorefresh import st_autorefresh
+
+from db_migrations import add_column, migrate
+from health_db import WriteBatcher, create_health_engine
+from lab_cache import ExtractionCache, content_key
+from lab_matcher import AliasMatcher
+from metrics import REGISTRY, inc, request, stage
+from reminder_outbox import OutboxDispatcher
+from reminder_recurrence import WEEKDAYS, expand_listing, make_rule
+from user_store import UserStore
+
+# pandas / numpy (lab_reference), pdfplumber (pdf_extract, lab_templates), smtplib
+# (smtp_pool) and streamlit_autorefresh are imported inside the functions
+# and pages that use them, so the login screen does not pay for them.
+_imports_ms = (time.perf_counter() - _script_started) * 1000
+
+# ------------------------------------------------------------
+# STARTUP TIMING
+# ------------------------------------------------------------
+# Process-wide: imports of the first run and the first render of each page
+# (which includes that page's lazy imports), printed once to stderr.
+@st.cache_resource
+def get_startup_timings():
+    return {"imports_ms": _imports_ms, "first_render_ms": {}, "last_render_ms": None}
+
+def record_render(page):
+    render_ms = (time.perf_counter() - _script_started) * 1000
+    timings = get_startup_timings()
+    timings["last_render_ms"] = render_ms
+    if page not in timings["first_render_ms"]:
+        timings["first_render_ms"][page] = render_ms
+        print(f"[startup] {page}: first render {render_ms:.0f} ms "
+              f"(process imports {timings['imports_ms']:.0f} ms)", file=sys.stderr)
 
 # ------------------------------------------------------------
 # STREAMLIT CONFIG
@@ -25,38 +56,45 @@ st.set_page_config(page_title="MediMind AI", layout="centered")
 # ------------------------------------------------------------
 # SESSION STATE
 # ------------------------------------------------------------
-if "logged_in" not in st.session_state:
-    st.session_state.logged_in = False
-if "users_db" not in st.session_state:
-    st.session_state.users_db = {}
-if "current_user" not in st.session_state:
-    st.session_state.current_user = None
+# Only the session token lives here; users are in the shared store
+if "session_token" not in st.session_state:
+    st.session_state.session_token = None
 
 # ------------------------------------------------------------
 # EMAIL FUNCTION
 # ------------------------------------------------------------
-def send_email(to_email, subject, body):
+# One pool of logged-in connections per process. SMTP_HOST / SMTP_PORT /
+# SMTP_SSL secrets point it at a local debugging server for testing.
+@st.cache_resource
+def get_smtp_pool():
+    from smtp_pool import SMTPPool
+    return SMTPPool(
+        st.secrets.get("SMTP_HOST", "smtp.gmail.com"),
+        int(st.secrets.get("SMTP_PORT", 465)),
+        username=st.secrets["EMAIL_ADDRESS"],
+        password=st.secrets.get("EMAIL_APP_PASSWORD"),
+        use_ssl=bool(st.secrets.get("SMTP_SSL", True)),
+        rate_limit=st.secrets.get("SMTP_RATE_LIMIT")
+    )
+
+def build_email(to_email, subject, body):
     msg = EmailMessage()
     msg["From"] = st.secrets["EMAIL_ADDRESS"]
     msg["To"] = to_email
     msg["Subject"] = subject
     msg.set_content(body)
+    return msg
 
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-        server.login(
-            st.secrets["EMAIL_ADDRESS"],
-            st.secrets["EMAIL_APP_PASSWORD"]
-        )
-        server.send_message(msg)
+def send_email(to_email, subject, body):
+    get_smtp_pool().send(build_email(to_email, subject, body))
+
+# items: [(to, subject, body), ...] -> one error (or None) per item
+def send_email_batch(items):
+    return get_smtp_pool().send_batch([build_email(*item) for item in items])
 
 # ------------------------------------------------------------
 # DATABASE – REMINDERS
 # ------------------------------------------------------------
-engine = create_engine(
-    "sqlite:///health_tracker.db",
-    connect_args={"check_same_thread": False}
-)
-SessionLocal = sessionmaker(bind=engine)
 Base = declarative_base()
 
 class Record(Base):
@@ -67,96 +105,185 @@ class Record(Base):
     scheduled_time = Column(DateTime)  # UTC
     status = Column(String(20), default="Pending")
     email = Column(String(200))
-
-Base.metadata.create_all(engine)
+    claimed_by = Column(String(100))  # dispatcher holding the lease
+    lease_expires = Column(DateTime)
+    # Recurring schedule (see reminder_recurrence); parent_id marks a fired dose
+    parent_id = Column(Integer)
+    repeat_minutes = Column(Integer)
+    repeat_days = Column(Integer)
+    repeat_until = Column(DateTime)
+    repeat_count = Column(Integer)
+
+    __table_args__ = (
+        Index("ix_records_status_time", "status", "scheduled_time"),
+        Index("ix_records_email_time", "email", "scheduled_time"),
+    )
+
+# Brings databases created before the indexes / lease / recurrence columns existed up to date
+RECORD_MIGRATIONS = [
+    (1, "index records(status, scheduled_time)",
+     ["CREATE INDEX IF NOT EXISTS ix_records_status_time ON records (status, scheduled_time)"]),
+    (2, "index records(email, scheduled_time)",
+     ["CREATE INDEX IF NOT EXISTS ix_records_email_time ON records (email, scheduled_time)"]),
+    (3, "records lease columns",
+     [add_column("records", "claimed_by", "VARCHAR(100)"),
+      add_column("records", "lease_expires", "DATETIME")]),
+    (4, "records recurrence columns",
+     [add_column("records", "parent_id", "INTEGER"),
+      add_column("records", "repeat_minutes", "INTEGER"),
+      add_column("records", "repeat_days", "INTEGER"),
+      add_column("records", "repeat_until", "DATETIME"),
+      add_column("records", "repeat_count", "INTEGER")]),
+]
+
+# Built once per process, not on every rerun. WAL + busy_timeout + pool
+# sizing are shared with application.py
+@st.cache_resource
+def get_database():
+    engine = create_health_engine()
+    Base.metadata.create_all(engine)
+    migrate(engine, "records", RECORD_MIGRATIONS)
+    return engine, sessionmaker(bind=engine)
+
+engine, SessionLocal = get_database()
 
 def get_db():
     return SessionLocal()
 
+@st.cache_resource
+def get_write_batcher():
+    # One writer thread per server: adds from all sessions share commits
+    return WriteBatcher(engine)
+
+# ------------------------------------------------------------
+# REMINDER LISTING (current user only, keyset pagination)
+# ------------------------------------------------------------
+IST = pytz.timezone("Asia/Kolkata")
+PAGE_SIZE = 20
+
+# Rows after the (scheduled_time, id) cursor; one extra row tells us
+# whether there is a next page. Served by ix_records_email_time.
+# Recurring schedules are not listed as rows: their upcoming doses are
+# expanded for this page only and merged in.
+def list_reminders(db, email, after=None, limit=PAGE_SIZE):
+    query = db.query(
+        Record.id, Record.name, Record.category, Record.scheduled_time, Record.status
+    ).filter(Record.email == email, Record.repeat_minutes.is_(None))
+    if after:
+        query = query.filter(tuple_(Record.scheduled_time, Record.id) > tuple_(*after))
+    rows = query.order_by(Record.scheduled_time, Record.id).limit(limit + 1).all()
+
+    schedules = db.query(Record).filter(
+        Record.email == email, Record.status == "Pending", Record.repeat_minutes.isnot(None)
+    ).all()
+    return expand_listing(rows, schedules, after, limit + 1, tz=IST)
+
+def reminders_table(rows):
+    import pandas as pd
+    df = pd.DataFrame(rows, columns=["id", "Name", "Type", "Time", "Status"])
+    # Stored as naive UTC; convert the whole column at once
+    df["Time"] = (pd.to_datetime(df["Time"]).dt.tz_localize("UTC")
+                  .dt.tz_convert(IST).dt.strftime("%Y-%m-%d %H:%M"))
+    return df.drop(columns="id")
+
+# ------------------------------------------------------------
+# REMINDER DISPATCH (one background thread per process)
+# ------------------------------------------------------------
+def compose_reminder(record):
+    return (
+        record.email,
+        "⏰ Health Reminder – MediMind AI",
+        f"Reminder: {record.name}"
+    )
+
+@st.cache_resource
+def get_reminder_dispatcher():
+    return OutboxDispatcher(engine, Record, send_email, compose_reminder,
+                            send_batch=send_email_batch, tz=IST).start()
+
+get_reminder_dispatcher()
+
 # ------------------------------------------------------------
 # SMARTLAB DATABASE (30+ TESTS + SYMPTOMS)
 # ------------------------------------------------------------
-def ensure_lab_database():
-    if os.path.exists("lab_data.csv"):
-        return
-
-    data = {
-        "Medical Term": [
-            "Hemoglobin","RBC Count","Hematocrit (PCV)","MCV","MCH","MCHC","RDW",
-            "Total WBC","Neutrophils","Lymphocytes","Monocytes","Eosinophils","Basophils",
-            "Platelets",
-            "Blood Urea Nitrogen","Creatinine","Blood Urea","Calcium","Phosphorus","Uric Acid",
-            "Total Cholesterol","Triglycerides",
-            "Total Bilirubin","Direct Bilirubin","Indirect Bilirubin",
-            "Total Protein","Albumin","Globulin","A/G Ratio",
-            "SGOT (AST)","SGPT (ALT)"
-        ],
-        "Unit": [
-            "g/dL","million/uL","%","fL","pg","g/dL","%",
-            "cells/cumm","%","%","%","%","%",
-            "cells/cumm",
-            "mg/dL","mg/dL","mg/dL","mg/dL","mg/dL","mg/dL",
-            "mg/dL","mg/dL",
-            "mg/dL","mg/dL","mg/dL",
-            "g/dL","g/dL","g/dL","ratio",
-            "U/L","U/L"
-        ],
-        "Min": [
-            13,4.5,40,83,27,31.5,11.6,
-            4000,40,20,2,1,0,
-            150000,
-            5,0.7,15,8.4,2.7,3,
-            0,0,
-            0.1,0,0.1,
-            6,3.5,2,1,
-            5,5
-        ],
-        "Max": [
-            17,5.5,50,101,32,34.5,14,
-            10000,80,40,10,6,1,
-            450000,
-            18,1.2,45,10.2,4.9,7,
-            200,150,
-            1.2,0.3,0.9,
-            8,5,3.5,2,
-            40,40
-        ],
-        "Meaning": [
-            "Carries oxygen","Red blood cells","Packed cell volume","RBC size","Hb per RBC",
-            "Hb concentration","RBC variation","Immune cells","Bacterial defense",
-            "Viral defense","Cleanup cells","Allergy response","Rare immune cells",
-            "Clotting cells","Kidney waste","Kidney filter","Protein waste",
-            "Bone health","Bone mineral","Gout marker",
-            "Cholesterol","Blood fats",
-            "Jaundice marker","Processed bilirubin","Unprocessed bilirubin",
-            "Nutrition","Liver protein","Immune protein","Protein balance",
-            "Liver enzyme","Liver enzyme"
-        ],
-        "Low Symptoms": [
-            "Fatigue, dizziness","Weakness","Anemia","Vitamin deficiency","Weakness",
-            "Low oxygen","Anemia","Frequent infections","Low immunity","Weak immunity",
-            "Poor cleanup","Low allergy response","Rare","Bleeding risk",
-            "Kidney failure","Muscle loss","Malnutrition","Bone weakness",
-            "Bone issues","Rare","Usually normal","Usually normal",
-            "Rare","Rare","Rare",
-            "Malnutrition","Liver disease","Immune issues","Protein imbalance",
-            "Rare","Rare"
-        ],
-        "High Symptoms": [
-            "Thick blood","Dehydration","Polycythemia","B12 deficiency","Iron overload",
-            "Blood disorders","Inflammation","Infection","Bacterial infection",
-            "Viral infection","Chronic inflammation","Allergies","Rare","Clot risk",
-            "Kidney stress","Kidney disease","Dehydration","Hypercalcemia",
-            "Bone disease","Gout pain","Heart disease","Pancreatitis",
-            "Jaundice","Liver blockage","Liver disease",
-            "Dehydration","Chronic inflammation","Infection","Liver disease",
-            "Hepatitis","Liver damage"
-        ]
-    }
-
-    pd.DataFrame(data).to_csv("lab_data.csv", index=False)
-
-ensure_lab_database()
+LAB_DATA = {
+    "Medical Term": [
+        "Hemoglobin","RBC Count","Hematocrit (PCV)","MCV","MCH","MCHC","RDW",
+        "Total WBC","Neutrophils","Lymphocytes","Monocytes","Eosinophils","Basophils",
+        "Platelets",
+        "Blood Urea Nitrogen","Creatinine","Blood Urea","Calcium","Phosphorus","Uric Acid",
+        "Total Cholesterol","Triglycerides",
+        "Total Bilirubin","Direct Bilirubin","Indirect Bilirubin",
+        "Total Protein","Albumin","Globulin","A/G Ratio",
+        "SGOT (AST)","SGPT (ALT)"
+    ],
+    "Unit": [
+        "g/dL","million/uL","%","fL","pg","g/dL","%",
+        "cells/cumm","%","%","%","%","%",
+        "cells/cumm",
+        "mg/dL","mg/dL","mg/dL","mg/dL","mg/dL","mg/dL",
+        "mg/dL","mg/dL",
+        "mg/dL","mg/dL","mg/dL",
+        "g/dL","g/dL","g/dL","ratio",
+        "U/L","U/L"
+    ],
+    "Min": [
+        13,4.5,40,83,27,31.5,11.6,
+        4000,40,20,2,1,0,
+        150000,
+        5,0.7,15,8.4,2.7,3,
+        0,0,
+        0.1,0,0.1,
+        6,3.5,2,1,
+        5,5
+    ],
+    "Max": [
+        17,5.5,50,101,32,34.5,14,
+        10000,80,40,10,6,1,
+        450000,
+        18,1.2,45,10.2,4.9,7,
+        200,150,
+        1.2,0.3,0.9,
+        8,5,3.5,2,
+        40,40
+    ],
+    "Meaning": [
+        "Carries oxygen","Red blood cells","Packed cell volume","RBC size","Hb per RBC",
+        "Hb concentration","RBC variation","Immune cells","Bacterial defense",
+        "Viral defense","Cleanup cells","Allergy response","Rare immune cells",
+        "Clotting cells","Kidney waste","Kidney filter","Protein waste",
+        "Bone health","Bone mineral","Gout marker",
+        "Cholesterol","Blood fats",
+        "Jaundice marker","Processed bilirubin","Unprocessed bilirubin",
+        "Nutrition","Liver protein","Immune protein","Protein balance",
+        "Liver enzyme","Liver enzyme"
+    ],
+    "Low Symptoms": [
+        "Fatigue, dizziness","Weakness","Anemia","Vitamin deficiency","Weakness",
+        "Low oxygen","Anemia","Frequent infections","Low immunity","Weak immunity",
+        "Poor cleanup","Low allergy response","Rare","Bleeding risk",
+        "Kidney failure","Muscle loss","Malnutrition","Bone weakness",
+        "Bone issues","Rare","Usually normal","Usually normal",
+        "Rare","Rare","Rare",
+        "Malnutrition","Liver disease","Immune issues","Protein imbalance",
+        "Rare","Rare"
+    ],
+    "High Symptoms": [
+        "Thick blood","Dehydration","Polycythemia","B12 deficiency","Iron overload",
+        "Blood disorders","Inflammation","Infection","Bacterial infection",
+        "Viral infection","Chronic inflammation","Allergies","Rare","Clot risk",
+        "Kidney stress","Kidney disease","Dehydration","Hypercalcemia",
+        "Bone disease","Gout pain","Heart disease","Pancreatitis",
+        "Jaundice","Liver blockage","Liver disease",
+        "Dehydration","Chronic inflammation","Infection","Liver disease",
+        "Hepatitis","Liver damage"
+    ]
+}
+
+def get_lab_reference():
+    # get_reference keeps one compiled table per process (reloaded if the CSV changes)
+    from lab_reference import get_reference
+    return get_reference("lab_data.csv", seed=LAB_DATA)
 
 # ------------------------------------------------------------
 # TEST SYNONYMS
@@ -186,45 +313,153 @@ TEST_SYNONYMS = {
     "SGPT (ALT)":["SGPT","ALT"]
 }
 
+# Text is upper-cased before matching; values must start within 40 chars.
+# Compiled once per process.
+@st.cache_resource
+def get_test_matcher():
+    return AliasMatcher(TEST_SYNONYMS, ignore_case=False, window=40)
+
 # ------------------------------------------------------------
 # PDF SCANNER
 # ------------------------------------------------------------
-def scan_pdf(path):
-    text = ""
-    with pdfplumber.open(path) as pdf:
-        for page in pdf.pages:
-            if page.extract_text():
-                text += page.extract_text() + " "
-
-    text = re.sub(r"\s+", " ", text.upper())
-    found = {}
-
-    for test, aliases in TEST_SYNONYMS.items():
-        for a in aliases:
-            m = re.search(a + r".{0,40}?(\d+\.?\d*)", text)
-            if m:
-                found[test] = float(m.group(1))
-                break
+def normalize_text(text):
+    return re.sub(r"\s+", " ", text.upper())
+
+# Learned per lab vendor, shared by all sessions (see lab_templates.py);
+# opt-in: None unless SMARTLAB_TEMPLATES names the file that keeps them
+@st.cache_resource
+def get_layout_templates():
+    path = os.environ.get("SMARTLAB_TEMPLATES")
+    if not path:
+        return None
+    from lab_templates import LayoutTemplates
+    return LayoutTemplates(path)
+
+# With SMARTLAB_TEMPLATES set, reports from a vendor with a layout template
+# are read from the template's regions only; otherwise:
+# lazy=True stops extracting pages once every test has a value;
+# workers > 1 (0 = all CPUs) extracts large reports on a process pool;
+# backend is "auto", "pdftotext" or "pdfplumber".
+# SMARTLAB_MAX_RSS_MB caps memory while extracting (MemoryError past it).
+def scan_pdf(source, lazy=False, workers=1, backend="auto", stats=None):
+    from pdf_extract import open_pdf, page_texts, rereadable, scan_pages
+    matcher = get_test_matcher()
+    source = rereadable(source)
+    templates = get_layout_templates()
+    found = templates.extract(source, matcher, normalize_text, stats=stats) if templates else None
+    if found is not None:
+        if stats is not None:
+            stats["template"] = True
+        return found
+
+    if lazy:
+        with open_pdf(source) as pdf:
+            found = scan_pages(pdf, matcher, normalize_text, stats=stats)
+    else:
+        text = "".join(page_text + " " for page_text in
+                       page_texts(source, backend, workers=workers, stats=stats) if page_text)
+        with stage("match"):
+            found = matcher.find(normalize_text(text))
+
+    if templates:
+        templates.learn(source, found, matcher, normalize_text, stats=stats)
     return found
 
+# A PDF holding several patients' reports back to back: one result per
+# patient, yielded as soon as that report's pages have been read
+def scan_bundle(source):
+    from pdf_extract import split_reports
+    matcher = get_test_matcher()
+    for patient, first_page, texts in split_reports(source):
+        with stage("match"):
+            extracted = matcher.find(normalize_text(" ".join(texts) + " "))
+        yield {"patient": patient, "first_page": first_page + 1, "pages": len(texts),
+               "extracted": extracted, "rows": analyze_report(extracted)}
+
 # ------------------------------------------------------------
 # INTERPRETER
 # ------------------------------------------------------------
 class MedicalInterpreter:
     def __init__(self):
-        self.db = pd.read_csv("lab_data.csv")
+        self.table = get_lab_reference()
 
     def analyze(self, term, value):
-        row = self.db[self.db["Medical Term"] == term].iloc[0]
-        if value < row["Min"]:
+        row = self.table.row(term)
+        status = self.table.status(term, value)
+        if status == "LOW":
             return row, "LOW", row["Low Symptoms"]
-        elif value > row["Max"]:
+        elif status == "HIGH":
             return row, "HIGH", row["High Symptoms"]
         return row, "NORMAL", "Within healthy range"
 
+    # LOW / NORMAL / HIGH for many reports at once (DataFrame or dict)
+    def analyze_many(self, values):
+        return self.table.classify(values)
+
+def analyze_report(extracted):
+    interpreter = MedicalInterpreter()
+    rows = []
+    with stage("analyze"):
+        for test, val in extracted.items():
+            row, status, symptom = interpreter.analyze(test, val)
+            rows.append({
+                "test": test,
+                "value": val,
+                "unit": str(row["Unit"]),
+                "status": status,
+                "meaning": str(row["Meaning"]),
+                "symptom": str(symptom)
+            })
+    return rows
+
+def show_report(rows):
+    for r in rows:
+        st.subheader(r["test"])
+        st.write(f"**Value:** {r['value']} {r['unit']}")
+        st.write(f"**Status:** {r['status']}")
+        st.write(f"**Meaning:** {r['meaning']}")
+        st.write(f"**Possible symptoms:** {r['symptom']}")
+        st.divider()
+
+def show_patient(report):
+    last = report["first_page"] + report["pages"] - 1
+    title = f"{report['patient'] or 'Unknown patient'} (pages {report['first_page']}-{last})"
+    with st.expander(title, expanded=False):
+        if report["extracted"]:
+            show_report(report["rows"])
+        else:
+            st.caption("No lab values detected")
+
+# ------------------------------------------------------------
+# EXTRACTION CACHE (shared by all sessions of this process)
+# ------------------------------------------------------------
+# Cached reports hold analysed rows, so the key covers the reference table
+# (its CSV's mtime / size) and the matcher's synonyms and window as well as
+# the PDF bytes
+def report_cache_key(data):
+    from lab_reference import source_stamp
+    get_lab_reference()  # writes lab_data.csv from LAB_DATA if it is missing
+    matcher = get_test_matcher()
+    version = json.dumps([source_stamp("lab_data.csv"), matcher.synonyms, matcher.window],
+                         sort_keys=True)
+    return content_key(data) + "-" + content_key(version.encode())[:16]
+
+@st.cache_resource
+def get_extraction_cache():
+    return ExtractionCache(disk_dir=os.environ.get("SMARTLAB_CACHE_DIR"))
+
 # ------------------------------------------------------------
 # LOGIN / REGISTER
 # ------------------------------------------------------------
+@st.cache_resource
+def get_user_store():
+    return UserStore(engine)
+
+user_store = get_user_store()
+# Served from the store's token cache on almost every rerun
+st.session_state.current_user = user_store.get_session(st.session_state.session_token)
+st.session_state.logged_in = st.session_state.current_user is not None
+
 if not st.session_state.logged_in:
     st.title("🧠 MediMind AI")
 
@@ -236,15 +471,11 @@ if not st.session_state.logged_in:
         password = st.text_input("Password", type="password")
 
         if st.button("Register"):
-            if username in st.session_state.users_db:
-                st.error("User already exists")
-            elif not email:
+            if not email:
                 st.error("Email required")
+            elif user_store.register(username, email, password) is None:
+                st.error("User already exists")
             else:
-                st.session_state.users_db[username] = {
-                    "password": password,
-                    "email": email
-                }
                 st.success("Registered successfully. Please login.")
 
     with tab2:
@@ -252,17 +483,14 @@ if not st.session_state.logged_in:
         password = st.text_input("Password", type="password", key="login_pass")
 
         if st.button("Login"):
-            user = st.session_state.users_db.get(username)
-            if user and user["password"] == password:
-                st.session_state.logged_in = True
-                st.session_state.current_user = {
-                    "username": username,
-                    "email": user["email"]
-                }
+            user = user_store.authenticate(username, password)
+            if user:
+                st.session_state.session_token = user_store.create_session(user)
                 st.rerun()
             else:
                 st.error("Invalid credentials")
 
+    record_render("Login")
     st.stop()
 
 # ------------------------------------------------------------
@@ -270,31 +498,86 @@ if not st.session_state.logged_in:
 # ------------------------------------------------------------
 page = st.sidebar.radio("Navigate", ["SmartLab AI", "Health Reminder", "Logout"])
 
+timings = get_startup_timings()
+if timings["last_render_ms"] is not None:
+    st.sidebar.caption(
+        f"Startup: imports {timings['imports_ms']:.0f} ms, "
+        f"last render {timings['last_render_ms']:.0f} ms"
+    )
+
+# Process-wide stage timings (metrics.py); profiles need METRICS_PROFILE_RATE
+if st.sidebar.checkbox("Show stage timings"):
+    stage_rows, counters = REGISTRY.summary()
+    with st.sidebar.expander("Stage timings", expanded=True):
+        if stage_rows:
+            st.dataframe(stage_rows, hide_index=True, width="stretch")
+        else:
+            st.caption("Nothing timed yet")
+        if counters:
+            st.caption(", ".join(f"{name}: {value}" for name, value in sorted(counters.items())))
+        for seconds, name, started, profile, path in REGISTRY.slowest:
+            st.caption(f"{name} at {started:%H:%M:%S}: {seconds * 1000:.0f} ms")
+            st.code(profile)
+
 # ------------------------------------------------------------
 # SMARTLAB AI
 # ------------------------------------------------------------
 if page == "SmartLab AI":
     st.title("🧪 SmartLab AI – Lab Report Analysis")
 
-    pdf = st.file_uploader("Upload Lab Report (PDF)", type=["pdf"])
-    if pdf:
-        with open("temp.pdf", "wb") as f:
-            f.write(pdf.read())
-
-        extracted = scan_pdf("temp.pdf")
-        interpreter = MedicalInterpreter()
+    cache = get_extraction_cache()
 
-        if not extracted:
+    pdf = st.file_uploader("Upload Lab Report (PDF)", type=["pdf"])
+    bundle = st.checkbox("This PDF holds several patients' reports")
+    if pdf and bundle:
+        data = pdf.getbuffer()
+        key = report_cache_key(data) + "-bundle"
+        reports = cache.get(key)
+        inc("report_cache_miss" if reports is None else "report_cache_hit")
+        if reports is None:
+            reports = []
+            try:
+                with request("smartlab_bundle"):
+                    # Each patient is shown as soon as their report has been read
+                    for report in scan_bundle(data):
+                        show_patient(report)
+                        reports.append(report)
+                cache.put(key, reports)
+            except MemoryError as e:
+                st.error(f"This PDF is too large to process here: {e}")
+        else:
+            for report in reports:
+                show_patient(report)
+        st.caption(f"{len(reports)} patient reports in this PDF")
+
+    elif pdf:
+        # Per-request view of the upload: no temp file, nothing shared
+        data = pdf.getbuffer()
+        with request("smartlab_upload"):
+            key = report_cache_key(data)
+            report = cache.get(key)
+            inc("report_cache_miss" if report is None else "report_cache_hit")
+
+            if report is None:
+                try:
+                    extracted = scan_pdf(data)
+                except MemoryError as e:
+                    st.error(f"This report is too large to process here: {e}")
+                    st.stop()
+                report = {"extracted": extracted, "rows": analyze_report(extracted)}
+                cache.put(key, report)
+
+        if not report["extracted"]:
             st.error("No lab values detected")
         else:
-            for test, val in extracted.items():
-                row, status, symptom = interpreter.analyze(test, val)
-                st.subheader(test)
-                st.write(f"**Value:** {val} {row['Unit']}")
-                st.write(f"**Status:** {status}")
-                st.write(f"**Meaning:** {row['Meaning']}")
-                st.write(f"**Possible symptoms:** {symptom}")
-                st.divider()
+            show_report(report["rows"])
+
+    c = cache.summary()
+    st.sidebar.caption(
+        f"Report cache: {c['memory_hits']} memory / {c['disk_hits']} disk hits, "
+        f"{c['misses']} misses ({c['hit_rate']:.0%})"
+    )
+    record_render(page)
 
 # ------------------------------------------------------------
 # HEALTH REMINDER (EMAIL)
@@ -302,6 +585,7 @@ if page == "SmartLab AI":
 elif page == "Health Reminder":
     st.title("⏰ Health Reminder")
 
+    from streamlit_autorefresh import st_autorefresh
     st_autorefresh(interval=30 * 1000, key="refresh")
 
     db = get_db()
@@ -311,45 +595,66 @@ elif page == "Health Reminder":
         name = st.text_input("Medicine / Vaccine")
         category = st.selectbox("Type", ["Medicine", "Vaccination"])
         local_time = st.datetime_input("Reminder Time")
+        with st.expander("Repeat"):
+            repeat_hours = st.number_input("Every (hours, 0 = once)", min_value=0, max_value=24 * 30, value=0)
+            repeat_days = st.multiselect("Only on", WEEKDAYS)
+            repeat_until = st.date_input("Until", value=None)
+            repeat_count = st.number_input("Number of doses (0 = no limit)", min_value=0, value=0)
         if st.form_submit_button("Add"):
-            ist = pytz.timezone("Asia/Kolkata")
-            utc = ist.localize(local_time).astimezone(timezone.utc)
+            utc = IST.localize(local_time).astimezone(timezone.utc).replace(tzinfo=None)
 
-            db.add(Record(
+            record = Record(
                 name=name,
                 category=category,
                 scheduled_time=utc,
                 email=user_email
-            ))
-            db.commit()
-            st.success("Reminder added")
-
-    now = datetime.utcnow().replace(tzinfo=timezone.utc)
-    for r in db.query(Record).filter(
-        Record.status == "Pending",
-        Record.scheduled_time <= now
-    ):
-        send_email(
-            r.email,
-            "⏰ Health Reminder – MediMind AI",
-            f"Reminder: {r.name}"
-        )
-        r.status = "Reminded"
-        db.commit()
-
-    for r in db.query(Record).all():
-        ist = pytz.timezone("Asia/Kolkata")
-        display_time = r.scheduled_time.astimezone(ist).strftime("%Y-%m-%d %H:%M")
-
-        st.write(f"{r.name} | {display_time} | {r.status}")
-
+            )
+            try:
+                if repeat_hours:
+                    until = None
+                    if repeat_until:
+                        end_of_day = IST.localize(datetime.combine(repeat_until, datetime.max.time()))
+                        until = end_of_day.astimezone(timezone.utc).replace(tzinfo=None)
+                    for column, value in make_rule(
+                        utc, int(repeat_hours) * 60, [WEEKDAYS.index(d) for d in repeat_days],
+                        until, int(repeat_count), tz=IST
+                    ).items():
+                        setattr(record, column, value)
+                get_write_batcher().submit(lambda session: session.add(record)).result()
+                st.success("Reminder added")
+            except ValueError as e:
+                st.error(str(e))
+
+    # Stack of page-start cursors; empty = first page
+    if "reminder_cursors" not in st.session_state:
+        st.session_state.reminder_cursors = []
+    cursors = st.session_state.reminder_cursors
+
+    with stage("reminder_list"):
+        rows = list_reminders(db, user_email, cursors[-1] if cursors else None)
+    page_rows, has_next = rows[:PAGE_SIZE], len(rows) > PAGE_SIZE
+
+    if page_rows:
+        st.dataframe(reminders_table(page_rows), hide_index=True, width="stretch")
+    else:
+        st.info("No reminders yet")
+
+    prev_col, next_col = st.columns(2)
+    if prev_col.button("◀ Previous", disabled=not cursors):
+        cursors.pop()
+        st.rerun()
+    if next_col.button("Next ▶", disabled=not has_next):
+        last = page_rows[-1]
+        cursors.append((last.scheduled_time, last.id))
+        st.rerun()
 
     db.close()
+    record_render(page)
 
 # ------------------------------------------------------------
 # LOGOUT
 # ------------------------------------------------------------
 else:
-    st.session_state.logged_in = False
-    st.session_state.current_user = None
+    user_store.end_session(st.session_state.session_token)
+    st.session_state.session_token = None
     st.rerun()
@@ -0,0 +1,143 @@
+import os
+import queue
+import socket
+import threading
+import uuid
+from concurrent.futures import Future
+
+from sqlalchemy import create_engine, event, or_
+from sqlalchemy.orm import sessionmaker
+
+# ------------------------------------------------------------
+# SHARED DATABASE SETUP
+# ------------------------------------------------------------
+# application.py (Flask-SQLAlchemy) and final.py (plain SQLAlchemy) both use
+# health_tracker.db. Every connection is switched to WAL, so readers never
+# block the writer, and waits up to busy_timeout for the write lock instead
+# of failing with "database is locked". synchronous=NORMAL is safe under WAL
+# and avoids an fsync per commit.
+
+DATABASE_URL = os.environ.get(
+    "HEALTH_DB_URL", "sqlite:///" + os.path.abspath("health_tracker.db")
+)
+
+SQLITE_PRAGMAS = [
+    ("journal_mode", "WAL"),
+    ("busy_timeout", "10000"),
+    ("synchronous", "NORMAL"),
+    ("temp_store", "MEMORY"),
+    ("cache_size", "-16000"),  # KiB
+]
+
+ENGINE_OPTIONS = {
+    "pool_size": 8,
+    "max_overflow": 8,
+    "pool_timeout": 30,
+    "pool_recycle": 3600,
+    "connect_args": {"check_same_thread": False, "timeout": 10},
+}
+
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS:
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def configure_engine(engine):
+    if engine.dialect.name == "sqlite" and not event.contains(engine, "connect", _apply_pragmas):
+        event.listen(engine, "connect", _apply_pragmas)
+    return engine
+
+
+def create_health_engine(url=DATABASE_URL):
+    options = ENGINE_OPTIONS if url.startswith("sqlite") else {
+        k: v for k, v in ENGINE_OPTIONS.items() if k != "connect_args"
+    }
+    return configure_engine(create_engine(url, **options))
+
+
+# ------------------------------------------------------------
+# BATCHED WRITES
+# ------------------------------------------------------------
+# SQLite has a single writer, so many small transactions from different
+# threads queue up on the lock and each pays its own commit. WriteBatcher
+# funnels writes through one thread that runs everything queued so far in a
+# single transaction (group commit). If that transaction fails, the writes
+# are replayed one by one so a bad write only fails its own caller.
+
+class WriteBatcher:
+    def __init__(self, engine, max_batch=200):
+        self.Session = sessionmaker(bind=engine, expire_on_commit=False)
+        self.max_batch = max_batch
+        self.stats = {"writes": 0, "commits": 0, "failed": 0}
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, write):
+        # write(session) adds / updates rows; the Future resolves to its
+        # return value once the batch containing it has been committed
+        future = Future()
+        self._queue.put((write, future))
+        return future
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._run(batch)
+
+    def _run(self, batch):
+        with self.Session() as session:
+            try:
+                results = [write(session) for write, _ in batch]
+                session.commit()
+            except Exception:
+                session.rollback()
+            else:
+                self.stats["commits"] += 1
+                self.stats["writes"] += len(batch)
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+                return
+
+        for write, future in batch:
+            with self.Session() as session:
+                try:
+                    result = write(session)
+                    session.commit()
+                except Exception as e:
+                    session.rollback()
+                    self.stats["failed"] += 1
+                    future.set_exception(e)
+                else:
+                    self.stats["commits"] += 1
+                    self.stats["writes"] += 1
+                    future.set_result(result)
+
+
+# ------------------------------------------------------------
+# LEASES
+# ------------------------------------------------------------
+# Lets several replicas work on the same table. A worker claims rows with
+# one conditional UPDATE that writes its id into claimed_by and a deadline
+# into lease_expires, and only touches rows whose claimed_by is its own id.
+# A row whose lease has run out (the worker crashed or hung) can be claimed
+# again by anyone, so work is never stuck but is also not done twice while
+# the owner is alive. Leases must outlast the work done under them.
+
+LEASE_SECONDS = 300
+
+
+def new_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def lease_free(model, now):
+    return or_(model.lease_expires.is_(None), model.lease_expires < now)
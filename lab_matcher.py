@@ -0,0 +1,146 @@
+import re
+
+# ==========================================
+# SINGLE-PASS ALIAS MATCHER
+# ==========================================
+# One combined scanner finds every position where any alias starts, so the
+# report text is walked once no matter how many tests / aliases we know.
+# Each alias keeps its first hit that is followed by a number, and the
+# per-test result follows the alias priority order of the synonym table.
+
+NUMBER = r"(\d+\.?\d*)"
+
+# Tokenized mode: numbers, words and single punctuation marks
+TOKEN = re.compile(r"\d+(?:\.\d+)?|[^\W\d]+|[^\w\s]")
+TOKEN_WINDOW = 8
+
+
+class AliasMatcher:
+    def __init__(self, synonyms, ignore_case=True, window=None):
+        self.synonyms = {test: list(aliases) for test, aliases in synonyms.items()}
+        self.window = window
+
+        flags = re.IGNORECASE if ignore_case else 0
+        self._fold = str.lower if ignore_case else (lambda s: s)
+
+        aliases = []
+        for test_aliases in self.synonyms.values():
+            for alias in test_aliases:
+                if alias not in aliases:
+                    aliases.append(alias)
+
+        # Longest first so the alternation never stops at a shared prefix
+        alternation = "|".join(re.escape(a) for a in sorted(aliases, key=len, reverse=True))
+        self._scanner = re.compile(r"(?=(?:%s))" % alternation, flags) if aliases else None
+
+        # Candidate aliases per (folded) first character
+        self._heads = {}
+        for alias in aliases:
+            self._heads.setdefault(self._fold(alias[0]), []).append(
+                (alias, re.compile(re.escape(alias), flags))
+            )
+        self._all = [entry for bucket in self._heads.values() for entry in bucket]
+
+        # Tokenized aliases keyed by their first token
+        self._token_heads = {}
+        for alias in aliases:
+            parts = TOKEN.findall(self._fold(alias))
+            if parts:
+                self._token_heads.setdefault(parts[0], []).append((alias, parts))
+
+        gap = r".*?" if window is None else r".{0,%d}?" % window
+        self._value = re.compile(gap + NUMBER)
+
+    def find_hits(self, text, hits=None):
+        # alias -> value for the first occurrence of each alias with a number
+        # after it; pass the previous result as `hits` to keep scanning page by page
+        hits = {} if hits is None else hits
+        if self._scanner is None:
+            return hits
+
+        remaining = len(self._all) - len(hits)
+        if not remaining:
+            return hits
+        for m in self._scanner.finditer(text):
+            pos = m.start()
+            bucket = self._heads.get(self._fold(text[pos]), self._all)
+            for alias, pattern in bucket:
+                if alias in hits:
+                    continue
+                head = pattern.match(text, pos)
+                if not head:
+                    continue
+                value = self._value.match(text, head.end())
+                if value:
+                    hits[alias] = float(value.group(1))
+                    remaining -= 1
+            if not remaining:
+                break
+        return hits
+
+    def tokenize(self, text):
+        return TOKEN.findall(self._fold(text))
+
+    def find_token_hits(self, tokens, window=TOKEN_WINDOW, examined=None, hits=None):
+        # Same as find_hits, but aliases must match whole tokens and the value
+        # has to be one of the next `window` tokens, so every token is looked
+        # at a bounded number of times no matter how long the report is.
+        hits = {} if hits is None else hits
+        remaining = sum(len(bucket) for bucket in self._token_heads.values()) - len(hits)
+        if remaining <= 0:
+            return hits
+        total = len(tokens)
+        for i, token in enumerate(tokens):
+            for alias, parts in self._token_heads.get(token, ()):
+                if alias in hits:
+                    continue
+                end = i + len(parts)
+                if tokens[i:end] != parts:
+                    continue
+                stop = min(end + window, total)
+                seen = 0
+                for j in range(end, stop):
+                    seen += 1
+                    if tokens[j][0].isdecimal():
+                        hits[alias] = float(tokens[j])
+                        remaining -= 1
+                        break
+                if examined is not None:
+                    examined[alias] = examined.get(alias, 0) + seen
+            if not remaining:
+                break
+        return hits
+
+    def find(self, text, tests=None):
+        return self.pick(self.find_hits(text), tests)
+
+    def find_tokens(self, text, tests=None, window=TOKEN_WINDOW, stats=None):
+        tokens = self.tokenize(text)
+        examined = {}
+        found = self.pick(self.find_token_hits(tokens, window, examined), tests)
+        if stats is not None:
+            stats["tokens"] = len(tokens)
+            stats["tokens_examined"] = self.examined_per_test(examined, tests)
+        return found
+
+    def examined_per_test(self, examined, tests=None):
+        return {
+            test: sum(examined.get(alias, 0) for alias in self.synonyms.get(test, ()))
+            for test in (self.synonyms if tests is None else tests)
+        }
+
+    def is_complete(self, hits, tests=None):
+        # True once every test has a value from one of its aliases
+        for test in (self.synonyms if tests is None else tests):
+            if not any(alias in hits for alias in self.synonyms.get(test, ())):
+                return False
+        return True
+
+    def pick(self, hits, tests=None):
+        found = {}
+        for test in (self.synonyms if tests is None else tests):
+            for alias in self.synonyms.get(test, ()):
+                if alias in hits:
+                    found[test] = hits[alias]
+                    break
+        return found
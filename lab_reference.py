@@ -0,0 +1,212 @@
+import json
+import mmap
+import os
+import struct
+import threading
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# REFERENCE TABLE
+# ==========================================
+# The reference ranges are held as a term -> position dict plus NumPy arrays
+# of Min / Max, so analyzing one value is a dict lookup and two float
+# comparisons, and a whole batch of reports is classified with a handful of
+# array operations instead of one DataFrame mask per value.
+
+LOW, NORMAL, HIGH, MISSING = 0, 1, 2, 3
+STATUS_LABELS = np.array(["LOW", "NORMAL", "HIGH", None], dtype=object)
+
+
+class ReferenceTable:
+    def __init__(self, columns):
+        # columns: column name -> sequence, with at least Medical Term / Min / Max.
+        # Min / Max may be (memory-mapped) float arrays; they are used as-is.
+        names = list(columns)
+        self.mins = np.asarray(columns["Min"], dtype=float)
+        self.maxs = np.asarray(columns["Max"], dtype=float)
+        self.mins.flags.writeable = False
+        self.maxs.flags.writeable = False
+
+        self.columns = {
+            name: tuple(values.tolist() if isinstance(values, np.ndarray) else values)
+            for name, values in columns.items()
+        }
+        self.terms = self.columns["Medical Term"]
+
+        self.index = {}
+        for i, term in enumerate(self.terms):
+            self.index.setdefault(term, i)  # first row wins, like .iloc[0]
+
+        self._bounds = list(zip(self.mins.tolist(), self.maxs.tolist()))
+        self._rows = [MappingProxyType(dict(zip(names, values)))
+                      for values in zip(*self.columns.values())]
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls({column: df[column].tolist() for column in df.columns})
+
+    def row(self, term):
+        i = self.index.get(term)
+        return None if i is None else self._rows[i]
+
+    def status(self, term, value):
+        min_val, max_val = self._bounds[self.index[term]]
+        if value < min_val:
+            return "LOW"
+        elif value > max_val:
+            return "HIGH"
+        return "NORMAL"
+
+    def classify(self, values):
+        # values: {test: value} for one report, {report: {test: value}},
+        # {test: [values...]} or a DataFrame with one row per report.
+        # Returns a DataFrame of LOW / NORMAL / HIGH (None where missing)
+        # for the known tests only.
+        frame = as_frame(values)
+        known = [c for c in frame.columns if c in self.index]
+        positions = np.fromiter((self.index[c] for c in known), dtype=np.intp, count=len(known))
+        data = frame[known].to_numpy(dtype=float, na_value=np.nan)
+
+        codes = np.full(data.shape, NORMAL, dtype=np.int8)
+        codes[data < self.mins[positions]] = LOW
+        codes[data > self.maxs[positions]] = HIGH
+        codes[np.isnan(data)] = MISSING
+        # dtype=object keeps None (pandas would otherwise infer strings and show NaN)
+        return pd.DataFrame(STATUS_LABELS[codes], index=frame.index, columns=known, dtype=object)
+
+
+def as_frame(values):
+    if isinstance(values, pd.DataFrame):
+        return values
+    if isinstance(values, dict):
+        items = list(values.values())
+        if items and all(isinstance(v, dict) for v in items):
+            return pd.DataFrame.from_dict(values, orient="index")
+        if all(np.ndim(v) == 0 for v in items):
+            return pd.DataFrame([values])
+    return pd.DataFrame(values)
+
+
+# ==========================================
+# COMPILED REFERENCE STORE
+# ==========================================
+# The CSV is parsed once and compiled into a small binary artifact next to
+# it (lab_data.csv -> lab_data.labref):
+#
+#   magic | header length (u32) | JSON header | pad to 8 | Min, Max as float64
+#
+# The header records the format version and the CSV's mtime / size. Loading
+# memory-maps the file and views Min / Max in place, so no CSV is parsed per
+# request. get_reference keeps one immutable table per CSV for the whole
+# process (every Streamlit session, every CLI worker) and only reloads it
+# when the CSV changes on disk.
+
+ARTIFACT_MAGIC = b"LABREF\x00\x00"
+ARTIFACT_VERSION = 1
+NUMERIC_COLUMNS = ("Min", "Max")
+
+_references = {}
+_references_lock = threading.Lock()
+
+
+def artifact_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".labref"
+
+
+def source_stamp(csv_path):
+    st = os.stat(csv_path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def compile_reference(csv_path, out_path=None):
+    out_path = out_path or artifact_path(csv_path)
+    stamp = source_stamp(csv_path)
+    df = pd.read_csv(csv_path)
+
+    header = json.dumps({
+        "version": ARTIFACT_VERSION,
+        "source": stamp,
+        "rows": len(df),
+        "order": list(df.columns),
+        "columns": {c: df[c].tolist() for c in df.columns if c not in NUMERIC_COLUMNS}
+    }).encode("utf-8")
+    numeric = np.stack([df[c].to_numpy(dtype="<f8") for c in NUMERIC_COLUMNS])
+
+    prefix = ARTIFACT_MAGIC + struct.pack("<I", len(header)) + header
+    padding = b"\x00" * (-len(prefix) % 8)
+
+    tmp = out_path + ".%d.tmp" % os.getpid()
+    with open(tmp, "wb") as f:
+        f.write(prefix + padding)
+        f.write(numeric.tobytes())
+    os.replace(tmp, out_path)
+    return out_path
+
+
+def load_artifact(path, stamp=None):
+    # Returns None when the artifact is from another format version or
+    # was compiled from a different revision of the CSV
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm[:len(ARTIFACT_MAGIC)] != ARTIFACT_MAGIC:
+        return None
+
+    start = len(ARTIFACT_MAGIC) + 4
+    (length,) = struct.unpack_from("<I", mm, len(ARTIFACT_MAGIC))
+    header = json.loads(mm[start:start + length])
+    if header["version"] != ARTIFACT_VERSION:
+        return None
+    if stamp is not None and header["source"] != stamp:
+        return None
+
+    rows = header["rows"]
+    offset = start + length + (-(start + length) % 8)
+    numeric = np.frombuffer(mm, dtype="<f8", count=rows * len(NUMERIC_COLUMNS),
+                            offset=offset).reshape(len(NUMERIC_COLUMNS), rows)
+
+    columns = {}
+    for name in header["order"]:
+        if name in NUMERIC_COLUMNS:
+            columns[name] = numeric[NUMERIC_COLUMNS.index(name)]
+        else:
+            columns[name] = header["columns"][name]
+    return ReferenceTable(columns)
+
+
+def _load_or_compile(csv_path, stamp):
+    path = artifact_path(csv_path)
+    try:
+        table = load_artifact(path, stamp)
+        if table is not None:
+            return table
+    except (OSError, ValueError, KeyError):
+        pass
+
+    try:
+        return load_artifact(compile_reference(csv_path, path), stamp) \
+            or ReferenceTable.from_frame(pd.read_csv(csv_path))
+    except OSError as e:
+        # Read-only checkout: fall back to parsing the CSV for this process
+        print(f"Could not write {path}: {e}")
+        return ReferenceTable.from_frame(pd.read_csv(csv_path))
+
+
+def get_reference(csv_path, seed=None):
+    # `seed` (column -> values) creates the CSV on first use if it is missing
+    with _references_lock:
+        if seed is not None and not os.path.exists(csv_path):
+            tmp = csv_path + ".%d.tmp" % os.getpid()
+            pd.DataFrame(seed).to_csv(tmp, index=False)
+            os.replace(tmp, csv_path)
+
+        stamp = source_stamp(csv_path)
+        cached = _references.get(csv_path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        table = _load_or_compile(csv_path, stamp)
+        _references[csv_path] = (stamp, table)
+        return table
@@ -0,0 +1,296 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import inc, stage
+from pdf_extract import MemoryBudget, open_pdf, release_page
+
+# ==========================================
+# LAYOUT TEMPLATES
+# ==========================================
+# Most reports come from a handful of lab vendors whose layouts never change.
+# A vendor is recognised from page 1: the page size and the words set in the
+# largest font in the top quarter (the lab's name; digits dropped, so report
+# numbers and dates do not matter). For a known vendor the template lists
+# the report's page count and, per test the vendor prints, the page and line
+# band holding its result and the alias used for it. Only the template's
+# pages are laid out, and only their results area (from the first band to
+# the foot of the page, one page.within_bbox crop per page) is read. Every
+# band must still show its aliases followed by a number, otherwise the
+# template is rejected and the caller falls back to the full-text scan; a
+# report with a different page count is a miss. Tests the template does not
+# place are looked for in the same results area, so a report that prints
+# more tests than the one the template was learned from still gives them.
+#
+# Templates are learned from full scans, from whichever tests they found:
+# each value is located on its line of words, and a vendor whose values
+# cannot all be located (wrapped cells, values split from their names), or
+# whose template is rejected MAX_REJECTIONS times in a row (labels that
+# change from report to report), is remembered as unusable. A vendor is
+# only learned once LEARN_AFTER of its reports have been scanned, so one-off
+# layouts never get a template, and at most MAX_TEMPLATES are kept (least
+# recently used dropped first). With a path, templates are kept as JSON and
+# shared by processes.
+
+HEADER_BAND = 0.25     # fraction of page 1 used for the fingerprint
+LINE_TOLERANCE = 3     # points; words this close vertically share a line
+BAND_PADDING = 2       # points above / below a learned line
+MAX_REJECTIONS = 3     # consecutive rejections before a vendor is given up
+LEARN_AFTER = 2        # full scans of a vendor's reports before it is learned
+MAX_TEMPLATES = 500    # templates kept in memory and in the file
+
+
+def _words(page):
+    return page.extract_words(extra_attrs=["size"])
+
+
+def fingerprint(page, words=None):
+    if words is None:
+        words = _words(page.within_bbox((0, 0, page.width, page.height * HEADER_BAND)))
+    words = [w for w in words if w["bottom"] <= page.height * HEADER_BAND]
+    if not words:
+        return None
+    size = max(round(w["size"], 1) for w in words)
+    title = " ".join(w["text"] for w in words if round(w["size"], 1) == size)
+    title = re.sub(r"[^A-Za-z]+", " ", title).strip().upper()
+    if not title:
+        return None
+    return f"{page.width:.0f}x{page.height:.0f}:{size:g}:{title}"
+
+
+def matcher_key(matcher):
+    # Templates hold only the tests a matcher looks for; one per matcher
+    spec = json.dumps([matcher.synonyms, matcher.window], sort_keys=True)
+    return hashlib.sha256(spec.encode()).hexdigest()[:12]
+
+
+def _line_text(words):
+    return " ".join(w["text"] for w in sorted(words, key=lambda w: w["x0"]))
+
+
+def _lines(words):
+    lines = []
+    for word in sorted(words, key=lambda w: (w["top"], w["x0"])):
+        if lines and word["top"] - lines[-1][0]["top"] <= LINE_TOLERANCE:
+            lines[-1].append(word)
+        else:
+            lines.append([word])
+    return [sorted(line, key=lambda w: w["x0"]) for line in lines]
+
+
+class LayoutTemplates:
+    def __init__(self, path=None):
+        self.path = path
+        self.templates = OrderedDict()  # "<matcher key>|<fingerprint>" -> template, LRU order
+        self._mtime = None
+        self._rejections = {}  # key -> rejections in a row (this process)
+        self._sightings = OrderedDict()  # key -> full scans not yet learned from
+        self._recent = threading.local()  # the source extract() last missed, and its key
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "mismatched": 0, "rejected": 0, "learned": 0,
+                      "unusable": 0}
+        self._reload()
+
+    # ---------- storage ----------
+    def _reload(self):
+        # Picks up templates other processes learned
+        if not self.path:
+            return
+        try:
+            mtime = os.path.getmtime(self.path)
+            if mtime == self._mtime:
+                return
+            with open(self.path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            self.templates.update(stored)
+            self._trim(self.templates)
+            self._mtime = mtime
+
+    @staticmethod
+    def _trim(templates):
+        while len(templates) > MAX_TEMPLATES:
+            templates.pop(next(iter(templates)))
+
+    def _save(self, key, template):
+        with self._lock:
+            self.templates.pop(key, None)
+            self.templates[key] = template
+            self._trim(self.templates)
+            if not self.path:
+                return
+            stored = {}
+            try:
+                with open(self.path) as f:
+                    stored = json.load(f, object_pairs_hook=OrderedDict)
+            except (OSError, ValueError):
+                pass
+            stored.pop(key, None)
+            stored[key] = template
+            self._trim(stored)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, "w") as f:
+                    json.dump(stored, f)
+                os.replace(tmp, self.path)
+                self._mtime = os.path.getmtime(self.path)
+            except OSError as e:
+                print(f"Could not save layout templates: {e}")
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+        inc(f"template_{key}")
+
+    def _reject(self, key):
+        with self._lock:
+            self._rejections[key] = self._rejections.get(key, 0) + 1
+        self._count("rejected")
+
+    # ---------- fast path ----------
+    def extract(self, source, matcher, normalize, tests=None, stats=None, max_rss_mb=None):
+        # Values read from the template's pages, or None (unknown vendor,
+        # unusable template or a page / region that does not match); pages
+        # are checked against the memory ceiling as in pdf_extract
+        self._reload()
+        self._recent.source = None
+        budget = MemoryBudget(max_rss_mb, stats)
+        with stage("template_extract"), open_pdf(source) as pdf:
+            if not pdf.pages:
+                return None
+            fp = fingerprint(pdf.pages[0])
+            key = f"{matcher_key(matcher)}|{fp}"
+            if fp is not None:
+                self._recent.source, self._recent.key = source, key
+            with self._lock:
+                template = self.templates.get(key)
+                if template is not None:
+                    self.templates.move_to_end(key)
+            if template is None or template["regions"] is None:
+                self._count("misses")
+                return None
+            if template.get("pages") != len(pdf.pages):
+                self._count("mismatched")
+                return None
+
+            by_page = {}
+            for region in template["regions"]:
+                by_page.setdefault(region["page"], []).append(region)
+
+            found, area_hits = {}, {}
+            for number, regions in sorted(by_page.items()):
+                page = pdf.pages[number]
+                # One crop from the first band to the foot of the page, then
+                # words per band
+                top = max(0, min(r["bbox"][1] for r in regions))
+                words = page.within_bbox((0, top, page.width, page.height)).extract_words()
+                budget.check(number)
+                release_page(page)
+                for region in regions:
+                    _, band_top, _, band_bottom = region["bbox"]
+                    band = [w for w in words if w["top"] >= band_top and w["bottom"] <= band_bottom]
+                    hits = matcher.find_hits(normalize(_line_text(band)))
+                    for test, alias in region["tests"].items():
+                        if alias not in hits:
+                            self._reject(key)
+                            return None
+                        if tests is None or test in tests:
+                            found.setdefault(test, hits[alias])
+                area = "\n".join(_line_text(line) for line in _lines(words))
+                matcher.find_hits(normalize(area + "\n"), area_hits)
+
+        # Tests the template does not place, if this report prints them
+        rest = [test for test in (matcher.synonyms if tests is None else tests)
+                if test not in found]
+        found.update(matcher.pick(area_hits, rest))
+        self._recent.source = None
+        with self._lock:
+            self._rejections.pop(key, None)
+        self._count("hits")
+        return found
+
+    # ---------- learning ----------
+    def _sighted(self, key):
+        # True when this report should be learned from: the vendor has a
+        # usable template that was just rejected, or this is its
+        # LEARN_AFTER-th report
+        known = self.templates.get(key)
+        if known is not None:
+            return known["regions"] is not None
+        with self._lock:
+            seen = self._sightings.pop(key, 0) + 1
+            if seen >= LEARN_AFTER:
+                return True
+            self._sightings[key] = seen
+            while len(self._sightings) > MAX_TEMPLATES:
+                self._sightings.popitem(last=False)
+        return False
+
+    def learn(self, source, found, matcher, normalize, stats=None, max_rss_mb=None):
+        # Builds the template for this report's vendor from the values a
+        # full scan found; replaces a template that was just rejected. Only
+        # the LEARN_AFTER-th report of a vendor is laid out, and the key
+        # extract() computed for a source it just missed is reused, so other
+        # reports cost no extra PDF open
+        key = getattr(self._recent, "source", None) is source and self._recent.key
+        self._recent.source = None
+        if not found:
+            return None
+        if key and not self._sighted(key):
+            return None
+        with stage("template_learn"), open_pdf(source) as pdf:
+            if not pdf.pages:
+                return None
+            if key:
+                fp = key.split("|", 1)[1]
+            else:
+                fp = fingerprint(pdf.pages[0])
+                if fp is None:
+                    return None
+                key = f"{matcher_key(matcher)}|{fp}"
+                if not self._sighted(key):
+                    return None
+            budget = MemoryBudget(max_rss_mb, stats)
+            first_words = _words(pdf.pages[0])
+
+            remaining = dict(found)
+            regions = []
+            given_up = self._rejections.get(key, 0) >= MAX_REJECTIONS
+            for number, page in enumerate([] if given_up else pdf.pages):
+                words = first_words if number == 0 else _words(page)
+                budget.check(number)
+                release_page(page)
+                for line in _lines(words):
+                    hits = matcher.find_hits(normalize(_line_text(line)))
+                    # test -> the highest-priority alias that reads its value here
+                    located = {}
+                    for test, value in remaining.items():
+                        for alias in matcher.synonyms.get(test, ()):
+                            if hits.get(alias) == value:
+                                located[test] = alias
+                                break
+                    if not located:
+                        continue
+                    top = max(0, min(w["top"] for w in line) - BAND_PADDING)
+                    bottom = min(page.height, max(w["bottom"] for w in line) + BAND_PADDING)
+                    regions.append({"page": number, "bbox": [0, top, float(page.width), bottom],
+                                    "tests": located})
+                    for test in located:
+                        del remaining[test]
+                if not remaining:
+                    break
+
+            pages = len(pdf.pages)
+
+        usable = not remaining
+        template = {"fingerprint": fp, "learned_at": time.time(), "pages": pages,
+                    "regions": regions if usable else None}
+        self._count("learned" if usable else "unusable")
+        self._save(key, template)
+        return template
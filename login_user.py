@@ -1,9 +1,13 @@
-from flask import Flask, request
+from flask import Flask, request, make_response
+
+from health_db import create_health_engine
+from user_store import UserStore
 
 app = Flask(__name__)
 
 
-users_db = {}
+# Shared with final.py through health_tracker.db
+user_store = UserStore(create_health_engine())
 
 
 register_page = """
@@ -62,14 +66,9 @@ def register():
     email = request.form.get("email")
     password = request.form.get("password")
 
-    if username in users_db:
+    if user_store.register(username, email, password) is None:
         return "<h3>User already exists!</h3><a href='/'>Try again</a>"
 
-    users_db[username] = {
-        "email": email,
-        "password": password
-    }
-
     return f"""
     <h2 style="color:green;">Registration Successful!</h2>
     <p>Welcome {username}</p>
@@ -83,11 +82,18 @@ def login():
         username = request.form.get("username")
         password = request.form.get("password")
 
-        if username in users_db and users_db[username]["password"] == password:
-            return f"<h2 style='color:green;'>Login Successful! Welcome {username}</h2>"
+        user = user_store.authenticate(username, password)
+        if user:
+            response = make_response(f"<h2 style='color:green;'>Login Successful! Welcome {username}</h2>")
+            response.set_cookie("session", user_store.create_session(user), httponly=True, samesite="Lax")
+            return response
         else:
             return "<h3>Invalid Username or Password</h3><a href='/login'>Try again</a>"
 
+    # Already logged in: checked against the session cache, not the database
+    user = user_store.get_session(request.cookies.get("session"))
+    if user:
+        return f"<h2 style='color:green;'>Welcome back {user['username']}</h2>"
     return login_page
 
 
@@ -0,0 +1,166 @@
+import bisect
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# ------------------------------------------------------------
+# STAGE METRICS
+# ------------------------------------------------------------
+# One registry per process. stage("name") times a block into a histogram
+# (fixed buckets, so an observation is a bisect and three additions under a
+# lock); inc("name") bumps a counter. application.py serves them at
+# /metrics in the Prometheus text format, final.py shows them in an optional
+# sidebar panel, and backend.py's batch mode writes them with --metrics
+# (its worker processes send each report's timings back with the report).
+# Other work done in extraction worker processes is not counted.
+#
+# Profiling: with METRICS_PROFILE_RATE=0.1, one request in ten runs under
+# cProfile (one at a time per process). The profiles of the slowest
+# METRICS_PROFILE_KEEP requests are kept in memory and, if
+# METRICS_PROFILE_DIR is set, written there as .prof files.
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PROFILE_RATE = float(os.environ.get("METRICS_PROFILE_RATE", 0))
+PROFILE_KEEP = int(os.environ.get("METRICS_PROFILE_KEEP", 5))
+PROFILE_DIR = os.environ.get("METRICS_PROFILE_DIR")
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    def __init__(self, profile_rate=PROFILE_RATE, profile_keep=PROFILE_KEEP, profile_dir=PROFILE_DIR):
+        self.histograms = {}
+        self.counters = {}
+        self.profile_rate = profile_rate
+        self.profile_keep = profile_keep
+        self.profile_dir = profile_dir
+        self.slowest = []  # [(seconds, name, started, stats text, path)], slowest first
+        self._lock = threading.Lock()
+        self._profiling = threading.Lock()
+
+    # ---------- recording ----------
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    @contextmanager
+    def request(self, name):
+        # stage() plus the sampled cProfile for the slowest requests
+        profiler = None
+        if self.profile_rate and random.random() < self.profile_rate \
+                and self._profiling.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:  # another profiler is active in this thread
+                self._profiling.release()
+                profiler = None
+        started = datetime.now()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe(name, seconds)
+            if profiler is not None:
+                profiler.disable()
+                self._profiling.release()
+                self._keep_profile(name, seconds, started, profiler)
+
+    def _keep_profile(self, name, seconds, started, profiler):
+        with self._lock:
+            if len(self.slowest) >= self.profile_keep and seconds <= self.slowest[-1][0]:
+                return
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(25)
+        path = None
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f"{name}-{started:%Y%m%d-%H%M%S}-{seconds * 1000:.0f}ms.prof")
+            profiler.dump_stats(path)
+        with self._lock:
+            self.slowest.append((seconds, name, started, out.getvalue(), path))
+            self.slowest.sort(key=lambda entry: entry[0], reverse=True)
+            del self.slowest[self.profile_keep:]
+
+    # ---------- reading ----------
+    def summary(self):
+        # One row per stage for dashboards / the Streamlit panel
+        with self._lock:
+            return [{
+                "stage": name,
+                "count": h.count,
+                "total_ms": h.sum * 1000,
+                "mean_ms": h.sum / h.count * 1000 if h.count else 0.0,
+                "p50_ms": h.quantile(0.5) * 1000,
+                "p95_ms": h.quantile(0.95) * 1000,
+            } for name, h in sorted(self.histograms.items())], dict(self.counters)
+
+    def prometheus(self, prefix="health"):
+        lines = [f"# HELP {prefix}_stage_seconds Time spent per pipeline stage",
+                 f"# TYPE {prefix}_stage_seconds histogram"]
+        with self._lock:
+            for name, h in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(h.buckets + (float("inf"),), h.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {h.sum}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {h.count}')
+            lines += [f"# HELP {prefix}_events_total Events counted by the pipelines",
+                      f"# TYPE {prefix}_events_total counter"]
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'{prefix}_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+stage = REGISTRY.stage
+request = REGISTRY.request
+observe = REGISTRY.observe
+inc = REGISTRY.inc
@@ -0,0 +1,503 @@
+import atexit
+import gc
+import io
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import pdfplumber
+
+from metrics import inc, observe, stage
+
+# ==========================================
+# PDF SOURCES
+# ==========================================
+# scan_pdf accepts a path, raw bytes / bytearray / memoryview, or an open
+# binary file-like object. In-memory sources are read through a view of the
+# caller's buffer, so nothing is written to disk and nothing is shared between
+# concurrent requests.
+
+
+class BufferReader(io.RawIOBase):
+    # Read-only, seekable file over an existing buffer (no upfront copy)
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast("B")
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        end = min(self._pos + len(b), len(self._view))
+        n = end - self._pos
+        b[:n] = self._view[self._pos:end]
+        self._pos = end
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = len(self._view) + offset
+        else:
+            raise ValueError(f"invalid whence: {whence}")
+        if pos < 0:
+            raise ValueError("negative seek position")
+        self._pos = pos
+        return pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+def as_stream(source):
+    if isinstance(source, (str, os.PathLike)):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return BufferReader(source)
+    if getattr(source, "seekable", lambda: False)():
+        source.seek(0)
+        return source
+    # Pipes / sockets: pdfminer needs random access
+    return BufferReader(source.read())
+
+
+def rereadable(source):
+    # A source that can be opened more than once (template pass, then the
+    # full scan); a pipe or socket is read into memory once, up front
+    if isinstance(source, (str, os.PathLike, bytes, bytearray, memoryview)):
+        return source
+    if getattr(source, "seekable", lambda: False)():
+        return source
+    return source.read()
+
+
+def open_pdf(source):
+    with stage("pdf_open"):
+        return pdfplumber.open(as_stream(source))
+
+
+def page_text(page):
+    with stage("page_extract_text"):
+        return page.extract_text() or ""
+
+
+def release_page(page):
+    # Drops the page's parsed layout objects; pdfplumber otherwise keeps them
+    # (and, class-wide, the text maps of recent pages) until the PDF is closed
+    page.close()
+
+
+def portable_source(source):
+    # Path or bytes that can be pickled to a worker process
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, (bytearray, memoryview)):
+        return bytes(source)
+    if getattr(source, "seekable", lambda: False)():
+        source.seek(0)
+    return source.read()
+
+
+# ==========================================
+# PAGE-PARALLEL EXTRACTION
+# ==========================================
+# Layout analysis is CPU-bound, so big bundles are split into contiguous page
+# ranges that worker processes extract independently; the texts are merged
+# back in page order, so matching sees exactly what the serial loop produced.
+# Pools are kept per worker count and reused across documents. Below
+# PARALLEL_MIN_PAGES the pool round trip costs more than it saves.
+PARALLEL_MIN_PAGES = 24
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(workers):
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            # spawn: forking a threaded server (Streamlit) can deadlock
+            pool = ProcessPoolExecutor(max_workers=workers,
+                                       mp_context=multiprocessing.get_context("spawn"))
+            _pools[workers] = pool
+        return pool
+
+
+@atexit.register
+def shutdown_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(cancel_futures=True)
+        _pools.clear()
+
+
+def _extract_range(source, start, stop):
+    with open_pdf(source) as pdf:
+        return [_read_and_release(page) for page in pdf.pages[start:stop]]
+
+
+def _read_and_release(page, budget=None):
+    text = page_text(page)
+    if budget is not None:
+        budget.check(page.page_number - 1)  # before release: the layout is still held
+    release_page(page)
+    return text
+
+
+# workers=0 uses every CPU; workers=1 is the plain serial loop. With a memory
+# ceiling (see BOUNDED-MEMORY EXTRACTION) pages are always read serially, so
+# each one can be checked
+def extract_page_texts(source, workers=1, min_pages=PARALLEL_MIN_PAGES, stats=None,
+                       max_rss_mb=None):
+    budget = MemoryBudget(max_rss_mb, stats)
+    workers = 1 if budget.max_rss_mb else workers or os.cpu_count() or 1
+    with open_pdf(source) as pdf:
+        total = len(pdf.pages)
+        if workers <= 1 or total < min_pages:
+            if stats is not None:
+                stats.update(pages_total=total, workers=1)
+            return [_read_and_release(page, budget) for page in pdf.pages]
+
+    workers = min(workers, total)
+    pool = get_pool(workers)
+    data = portable_source(source)
+    step = -(-total // workers)
+    futures = [pool.submit(_extract_range, data, start, min(start + step, total))
+               for start in range(0, total, step)]
+
+    texts = []
+    for future in futures:
+        texts.extend(future.result())
+    budget.sample()
+    if stats is not None:
+        stats.update(pages_total=total, workers=workers)
+    return texts
+
+
+# ==========================================
+# PAGE-LAZY MATCHING
+# ==========================================
+# Pages are laid out one at a time and only aliases that are still
+# unresolved are looked for; once every test has a value the remaining pages
+# are never extracted. A short tail of each page is carried into the next so
+# a value that wraps onto the following page is still found. Alias priority
+# applies among the pages read so far, so stopping early can keep a
+# lower-priority alias that a later page would have overridden.
+CARRY_CHARS = 200
+
+
+def scan_pages(pdf, matcher, normalize, tests=None, tokenized=False, stats=None,
+               max_rss_mb=None):
+    budget = MemoryBudget(max_rss_mb, stats)
+    hits = {}
+    examined = {}
+    carry = ""
+    parsed = 0
+    total = len(pdf.pages)
+    matching = 0.0  # alias matching only, summed over the pages read
+
+    for page in pdf.pages:
+        text = normalize(carry + "\n" + _read_and_release(page, budget))
+        parsed += 1
+
+        start = time.perf_counter()
+        if tokenized:
+            matcher.find_token_hits(matcher.tokenize(text), examined=examined, hits=hits)
+        else:
+            matcher.find_hits(text, hits)
+        complete = matcher.is_complete(hits, tests)
+        matching += time.perf_counter() - start
+        if complete:
+            break
+
+        # Start the carried tail on a word boundary
+        tail = text[-CARRY_CHARS:]
+        carry = tail[tail.find(" ") + 1:]
+
+    observe("match", matching)
+    if stats is not None:
+        stats.update(pages_total=total, pages_parsed=parsed, pages_skipped=total - parsed,
+                     match_seconds=matching)
+        if tokenized:
+            stats["tokens_examined"] = matcher.examined_per_test(examined, tests)
+    return matcher.pick(hits, tests)
+
+
+# ==========================================
+# MULTI-PATIENT BUNDLES
+# ==========================================
+# Some labs send one PDF with many patients' reports back to back. Pages are
+# read one at a time and released, and a new report starts on a page
+# numbered "Page 1 of N" or on a page whose header names a different patient
+# than the current report, whatever its page number says (some bundles are
+# numbered "Page i of N" across all patients). Pages without a patient
+# header (continuations, notes) stay with the current report, so only one
+# report's texts are held at a time.
+PAGE_NUMBER = re.compile(r"\bPAGE\s*(\d+)\s*(?:OF|/)\s*\d+", re.IGNORECASE)
+PATIENT_FIELD = re.compile(
+    r"\b(?:PATIENT\s*(?:NAME|ID)?|MRN|UHID)\s*[:\-]\s*"
+    r"(.+?)\s*(?:\s{2}|\b(?:AGE|SEX|GENDER|REPORT|DATE|REF|ID|UHID|MRN)\b|$)",
+    re.IGNORECASE)
+HEADER_LINES = 8
+
+
+def page_number(text):
+    match = PAGE_NUMBER.search(text)
+    return int(match.group(1)) if match else None
+
+
+def patient_key(text):
+    # Patient named in the page header, or None
+    for line in text.splitlines()[:HEADER_LINES]:
+        match = PATIENT_FIELD.search(line)
+        if match:
+            key = re.sub(r"\s+", " ", match.group(1)).strip().upper()
+            if key:
+                return key
+    return None
+
+
+def split_reports(source, stats=None, max_rss_mb=None):
+    # Yields (patient, first page, [page texts]) per report in the bundle
+    budget = MemoryBudget(max_rss_mb, stats)
+    with open_pdf(source) as pdf:
+        patient, first, texts = None, 0, []
+        for number, page in enumerate(pdf.pages):
+            text = page_text(page)
+            budget.check(number)
+            release_page(page)
+            numbered, named = page_number(text), patient_key(text)
+            starts = numbered == 1 or (named is not None and patient is not None
+                                       and named != patient)
+            if texts and starts:
+                yield patient, first, texts
+                patient, first, texts = None, number, []
+            patient = patient or named
+            texts.append(text)
+        if texts:
+            yield patient, first, texts
+        if stats is not None:
+            stats["pages_total"] = len(pdf.pages)
+
+
+# ==========================================
+# BOUNDED-MEMORY EXTRACTION
+# ==========================================
+# pdfplumber keeps every page's layout objects until the PDF is closed, so
+# big reports with a text layer can take hundreds of MB. Pages are always
+# released once their text is read, and every in-process pass over a
+# document (full extraction, page-lazy matching, bundle splitting, layout
+# templates) checks the resident set size after each page against a ceiling
+# (max_rss_mb, default SMARTLAB_MAX_RSS_MB): past it, after a garbage
+# collection, the document is abandoned with MemoryLimitExceeded rather than
+# the worker being OOM-killed. With a ceiling pdfplumber pages are read
+# serially. The ceiling is for the whole process, so leave room for what the
+# app itself holds. stats always gets the highest RSS seen while the document
+# was read (peak_rss_mb) and the process's all-time peak (process_peak_rss_mb).
+MAX_RSS_MB = float(os.environ.get("SMARTLAB_MAX_RSS_MB") or 0) or None
+
+
+class MemoryLimitExceeded(MemoryError):
+    pass
+
+
+def process_peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024  # bytes vs KiB
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return process_peak_rss_mb()  # best available without /proc
+
+
+class MemoryBudget:
+    # Budgets sharing a stats dict keep its peak_rss_mb at the highest of them
+    def __init__(self, max_rss_mb=None, stats=None):
+        self.max_rss_mb = max_rss_mb if max_rss_mb is not None else MAX_RSS_MB
+        self.stats = stats
+        self.peak = None
+        self.sample()
+
+    def sample(self):
+        current = rss_mb()
+        if current is None:
+            return None
+        self.peak = max(self.peak or 0, current)
+        if self.stats is not None:
+            self.stats["peak_rss_mb"] = max(self.stats.get("peak_rss_mb") or 0, current)
+            self.stats["process_peak_rss_mb"] = process_peak_rss_mb()
+        return current
+
+    def check(self, page_number):
+        current = self.sample()
+        if current is None:
+            return
+        if self.max_rss_mb and current > self.max_rss_mb:
+            gc.collect()
+            current = rss_mb()
+            if current > self.max_rss_mb:
+                inc("memory_limit_exceeded")
+                raise MemoryLimitExceeded(
+                    f"{current:.0f} MB resident after page {page_number + 1} "
+                    f"(limit {self.max_rss_mb:.0f} MB)")
+
+
+# ==========================================
+# EXTRACTION BACKENDS
+# ==========================================
+# A backend turns a source into one text per page. pdftotext (poppler-utils,
+# see packages.txt) runs the layout engine in C and is much faster per page
+# than pdfplumber's pure-Python one; pdfplumber stays the reference backend
+# and the fallback whenever pdftotext is missing, fails or returns no text.
+# Tiny documents stay in-process, where a subprocess would cost more than
+# the extraction itself.
+PDFTOTEXT_TIMEOUT = 120
+PDFTOTEXT_MIN_BYTES = 16 * 1024
+
+
+class PdfplumberBackend:
+    name = "pdfplumber"
+
+    def available(self):
+        return True
+
+    def page_texts(self, source, workers=1, stats=None, max_rss_mb=None):
+        return extract_page_texts(source, workers=workers, stats=stats, max_rss_mb=max_rss_mb)
+
+
+class PdftotextBackend:
+    name = "pdftotext"
+
+    def available(self):
+        return shutil.which("pdftotext") is not None
+
+    def page_texts(self, source, workers=1, stats=None):
+        command = ["pdftotext", "-layout", "-enc", "UTF-8"]
+        if isinstance(source, (str, os.PathLike)):
+            command += [os.fspath(source), "-"]
+            data = None
+        else:
+            command += ["-", "-"]  # PDF on stdin, text on stdout
+            data = source if isinstance(source, (bytes, bytearray, memoryview)) \
+                else portable_source(source)
+
+        with stage("pdftotext"):
+            result = subprocess.run(command, input=data, capture_output=True,
+                                    timeout=PDFTOTEXT_TIMEOUT, check=True)
+        pages = result.stdout.decode("utf-8", "replace").split("\f")
+        if pages and not pages[-1].strip():
+            pages.pop()  # pdftotext ends every page with a form feed
+        if stats is not None:
+            stats["pages_total"] = len(pages)
+        return pages
+
+
+BACKENDS = {backend.name: backend for backend in (PdfplumberBackend(), PdftotextBackend())}
+
+
+def source_size(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return memoryview(source).nbytes
+    if getattr(source, "seekable", lambda: False)():
+        return source.seek(0, io.SEEK_END)
+    return 0
+
+
+def select_backend(source, backend="auto"):
+    if backend != "auto":
+        return BACKENDS[backend]
+    fast = BACKENDS["pdftotext"]
+    if fast.available() and source_size(source) >= PDFTOTEXT_MIN_BYTES:
+        return fast
+    return BACKENDS["pdfplumber"]
+
+
+def page_texts(source, backend="auto", workers=1, stats=None, max_rss_mb=None):
+    chosen = select_backend(source, backend)
+    start = time.perf_counter()
+    texts = None
+
+    if chosen.name != "pdfplumber":
+        try:
+            if chosen.available():
+                texts = chosen.page_texts(source, workers=workers, stats=stats)
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"{chosen.name} failed, using pdfplumber: {e}", file=sys.stderr)
+            inc(f"{chosen.name}_fallback")
+        if texts is not None and not any(text.strip() for text in texts):
+            texts = None
+
+    if texts is None:
+        chosen = BACKENDS["pdfplumber"]
+        texts = chosen.page_texts(source, workers=workers, stats=stats, max_rss_mb=max_rss_mb)
+    else:
+        # pdftotext lays pages out in its own process, outside the ceiling
+        MemoryBudget(max_rss_mb, stats)
+
+    seconds = time.perf_counter() - start
+    observe("extract", seconds)
+    inc(f"pages_{chosen.name}", len(texts))
+    if stats is not None:
+        stats.update(backend=chosen.name, extract_seconds=seconds)
+    return texts
+
+
+def compare_backends(source, repeat=3):
+    # Best-of-`repeat` wall time per available backend, without fallbacks
+    results = {}
+    for name, backend in BACKENDS.items():
+        if not backend.available():
+            continue
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            texts = backend.page_texts(source)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = {"seconds": best, "pages": len(texts),
+                         "chars": sum(len(text) for text in texts)}
+    return results
+
+
+# python pdf_extract.py reports/*.pdf -> per-backend timings for a corpus
+if __name__ == "__main__":
+    totals = {}
+    for path in sys.argv[1:]:
+        for name, result in compare_backends(path).items():
+            print(f"{path}\t{name}\t{result['seconds'] * 1000:.1f} ms\t"
+                  f"{result['pages']} pages\t{result['chars']} chars")
+            totals[name] = totals.get(name, 0.0) + result["seconds"]
+    for name, seconds in sorted(totals.items(), key=lambda item: item[1]):
+        print(f"TOTAL\t{name}\t{seconds:.3f} s")
@@ -0,0 +1,271 @@
+import threading
+import traceback
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text, and_, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from db_migrations import add_column, migrate
+from health_db import LEASE_SECONDS, lease_free, new_worker_id
+from metrics import inc, stage
+from reminder_recurrence import fire_occurrence, is_recurring
+
+# ------------------------------------------------------------
+# REMINDER OUTBOX
+# ------------------------------------------------------------
+# Due reminders are moved into an `outbox` table and e-mailed by one
+# background thread per process, so page renders only read state and the
+# number of open browser tabs no longer matters.
+#
+#   records.status:  Pending -> Queued -> Reminded  (or Failed)
+#   outbox.status:   Queued -> Sending -> Sent  (or back to Queued / Failed)
+#
+# A message that runs out of attempts fails its record with it, so listings
+# never show a reminder as Queued that will not be sent.
+#
+# Every transition is a conditional UPDATE on the current status, and
+# outbox.record_id is unique, so a reminder is queued at most once even if
+# several processes run a dispatcher against the same database. Each step
+# claims a whole batch with one UPDATE that stamps the dispatcher's id and a
+# lease (see health_db), so concurrent dispatchers take different slices of
+# the due rows. A message left in Sending by a dispatcher that died is
+# claimed again once its lease expires. A due recurring schedule queues a
+# copy of the dose (see reminder_recurrence) and stays Pending for the next.
+
+OutboxBase = declarative_base()
+
+
+class OutboxMessage(OutboxBase):
+    __tablename__ = "outbox"
+    id = Column(Integer, primary_key=True)
+    record_id = Column(Integer, unique=True, nullable=False)
+    to_email = Column(String(200))
+    subject = Column(String(200))
+    body = Column(Text)
+    status = Column(String(20), default="Queued")
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime)
+    sent_at = Column(DateTime)
+    last_error = Column(Text)
+    claimed_by = Column(String(100))
+    lease_expires = Column(DateTime)
+
+    __table_args__ = (Index("ix_outbox_status_id", "status", "id"),)
+
+
+OUTBOX_MIGRATIONS = [
+    (1, "index outbox(status, id)",
+     ["CREATE INDEX IF NOT EXISTS ix_outbox_status_id ON outbox (status, id)"]),
+    (2, "outbox lease columns",
+     [add_column("outbox", "claimed_by", "VARCHAR(100)"),
+      add_column("outbox", "lease_expires", "DATETIME")]),
+]
+
+
+def utc_now():
+    # Naive UTC, matching how SQLite stores Record.scheduled_time
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class OutboxDispatcher:
+    def __init__(self, engine, record_model, send, compose, send_batch=None,
+                 interval=10, batch_size=100, max_attempts=5, lease=LEASE_SECONDS,
+                 worker_id=None, tz=None):
+        # send(to, subject, body) delivers one mail; send_batch([(to, subject,
+        # body), ...]), if given, delivers a whole batch and returns one error
+        # (or None) per item; compose(record) -> (to, subject, body).
+        # record_model needs claimed_by / lease_expires columns; `lease` must
+        # be longer than sending one batch takes; tz is the zone weekday
+        # rules of recurring reminders are judged in
+        self.Record = record_model
+        self.send = send
+        self.send_batch = send_batch
+        self.compose = compose
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.lease = timedelta(seconds=lease)
+        self.worker_id = worker_id or new_worker_id()
+        self.tz = tz
+
+        self.Session = sessionmaker(bind=engine)
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "lost": 0, "runs": 0}
+        self._stop = threading.Event()
+        self._thread = None
+
+        OutboxBase.metadata.create_all(engine)
+        migrate(engine, "outbox", OUTBOX_MIGRATIONS)
+
+    # ---------- Pending records -> outbox ----------
+    def enqueue_due(self):
+        Record = self.Record
+        now = utc_now()
+        expires = now + self.lease
+        with self.Session() as session:
+            due = (select(Record.id)
+                   .where(Record.status == "Pending", Record.scheduled_time <= now,
+                          lease_free(Record, now))
+                   .order_by(Record.scheduled_time)
+                   .limit(self.batch_size))
+            session.execute(
+                update(Record)
+                .where(Record.id.in_(due.scalar_subquery()))
+                .values(claimed_by=self.worker_id, lease_expires=expires)
+            )
+            # (worker id, expiry) identifies exactly the rows this UPDATE claimed
+            claimed = (session.query(Record)
+                       .filter(Record.claimed_by == self.worker_id,
+                               Record.lease_expires == expires,
+                               Record.status == "Pending")
+                       .all())
+            for record in claimed:
+                if is_recurring(record):
+                    dose = fire_occurrence(record, self.tz)
+                    dose.status = "Queued"
+                    session.add(dose)
+                    session.flush()  # assigns dose.id
+                else:
+                    dose = record
+                    record.status = "Queued"
+                    record.lease_expires = None
+                to_email, subject, body = self.compose(dose)
+                session.add(OutboxMessage(record_id=dose.id, to_email=to_email,
+                                          subject=subject, body=body, created_at=now))
+            try:
+                session.commit()
+            except IntegrityError:
+                session.rollback()
+                return 0
+        self.stats["queued"] += len(claimed)
+        inc("reminders_queued", len(claimed))
+        return len(claimed)
+
+    # ---------- outbox -> SMTP ----------
+    def claim_messages(self, session):
+        now = utc_now()
+        expires = now + self.lease
+        # Give up on messages whose last attempt's lease ran out too often
+        given_up = (select(OutboxMessage.record_id)
+                    .where(OutboxMessage.status == "Sending", OutboxMessage.lease_expires < now,
+                           OutboxMessage.attempts >= self.max_attempts))
+        session.execute(
+            update(self.Record)
+            .where(self.Record.id.in_(given_up.scalar_subquery()), self.Record.status == "Queued")
+            .values(status="Failed"),
+            execution_options={"synchronize_session": False}
+        )
+        session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.status == "Sending", OutboxMessage.lease_expires < now,
+                   OutboxMessage.attempts >= self.max_attempts)
+            .values(status="Failed", last_error="lease expired", lease_expires=None)
+        )
+        claimable = (select(OutboxMessage.id)
+                     .where(or_(OutboxMessage.status == "Queued",
+                                and_(OutboxMessage.status == "Sending",
+                                     OutboxMessage.lease_expires < now)))
+                     .order_by(OutboxMessage.id)
+                     .limit(self.batch_size))
+        session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(claimable.scalar_subquery()))
+            .values(status="Sending", attempts=OutboxMessage.attempts + 1,
+                    claimed_by=self.worker_id, lease_expires=expires)
+        )
+        session.commit()
+        return (session.query(OutboxMessage)
+                .filter(OutboxMessage.claimed_by == self.worker_id,
+                        OutboxMessage.lease_expires == expires,
+                        OutboxMessage.status == "Sending")
+                .order_by(OutboxMessage.id)
+                .all())
+
+    def deliver(self):
+        with self.Session() as session:
+            messages = self.claim_messages(session)
+            errors = self._send_all([(m.to_email, m.subject, m.body) for m in messages])
+            for message, error in zip(messages, errors):
+                if error is not None:
+                    values = {"last_error": str(error),
+                              "status": "Failed" if message.attempts >= self.max_attempts else "Queued"}
+                else:
+                    values = {"status": "Sent", "sent_at": utc_now()}
+                # Only finish messages this dispatcher still holds the lease on
+                finished = session.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.id == message.id,
+                           OutboxMessage.claimed_by == self.worker_id,
+                           OutboxMessage.lease_expires == message.lease_expires,
+                           OutboxMessage.status == "Sending")
+                    .values(lease_expires=None, **values),
+                    execution_options={"synchronize_session": False}
+                ).rowcount
+                if not finished:
+                    self.stats["lost"] += 1
+                    inc("reminders_lost")
+                    continue
+                if error is not None:
+                    if values["status"] == "Failed":
+                        session.execute(
+                            update(self.Record)
+                            .where(self.Record.id == message.record_id,
+                                   self.Record.status == "Queued")
+                            .values(status="Failed"),
+                            execution_options={"synchronize_session": False}
+                        )
+                    self.stats["failed"] += 1
+                    inc("reminders_failed")
+                    continue
+                session.execute(
+                    update(self.Record)
+                    .where(self.Record.id == message.record_id)
+                    .values(status="Reminded")
+                )
+                self.stats["sent"] += 1
+                inc("reminders_sent")
+            session.commit()
+            return len(messages)
+
+    def _send_all(self, items):
+        if not items:
+            return []
+        if self.send_batch is not None:
+            return self.send_batch(items)
+        errors = []
+        for item in items:
+            try:
+                self.send(*item)
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+        return errors
+
+    def run_once(self):
+        with stage("reminder_enqueue"):
+            self.enqueue_due()
+        with stage("reminder_deliver"):
+            sent = self.deliver()
+        self.stats["runs"] += 1
+        return sent
+
+    # ---------- background thread ----------
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="reminder-outbox", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                traceback.print_exc()
+            self._stop.wait(self.interval)
@@ -0,0 +1,138 @@
+from collections import namedtuple
+from datetime import timedelta, timezone
+
+from sqlalchemy import inspect
+
+# ------------------------------------------------------------
+# RECURRING REMINDERS
+# ------------------------------------------------------------
+# A course of doses is one schedule row whose scheduled_time is always its
+# next occurrence, plus a rule:
+#   repeat_minutes  time between doses
+#   repeat_days     weekday bitmask (bit 0 = Monday), empty = every day
+#   repeat_until    no occurrence after this time
+#   repeat_count    number of doses (folded into repeat_until on creation)
+# Because scheduled_time is the next dose, the due-reminder queries, leases
+# and schedulers work on schedules unchanged. When a dose fires it is copied
+# into its own row (parent_id = schedule id) and the schedule moves on, so
+# rows grow with doses taken, not with the length of the course. Listings
+# expand upcoming doses only for the page being shown.
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+# Columns that describe the schedule rather than a single dose
+SCHEDULE_COLUMNS = {"id", "parent_id", "scheduled_time", "status", "claimed_by", "lease_expires",
+                    "repeat_minutes", "repeat_days", "repeat_until", "repeat_count"}
+
+# A not-yet-fired dose in a listing, shaped like the listed rows
+Occurrence = namedtuple("Occurrence", "id name category scheduled_time status")
+
+
+def days_mask(days):
+    return sum(1 << day for day in days)
+
+
+def is_recurring(record):
+    return bool(record.repeat_minutes)
+
+
+def _allowed(t, mask, tz):
+    if not mask:
+        return True
+    if tz is not None:
+        # Stored times are naive UTC; weekdays count in the user's zone
+        t = t.replace(tzinfo=timezone.utc).astimezone(tz)
+    return mask >> t.weekday() & 1
+
+
+def _first_allowed(t, step, mask, until, tz):
+    # First step from t that falls on an allowed weekday; the weekday
+    # pattern repeats within a week's worth of steps
+    for _ in range(int(timedelta(days=7) / step) + 7):
+        if until is not None and t > until:
+            return None
+        if _allowed(t, mask, tz):
+            return t
+        t += step
+    return None
+
+
+def make_rule(start, every_minutes, days=(), until=None, count=None, tz=None):
+    # Column values for a new schedule; raises ValueError if it never fires
+    step = timedelta(minutes=every_minutes)
+    mask = days_mask(days) or None
+    first = _first_allowed(start, step, mask, until, tz)
+    if first is None:
+        raise ValueError("no reminder time matches this schedule")
+
+    if count:
+        # Walk the course once here so expansion never has to count doses
+        last = first
+        for _ in range(count - 1):
+            following = _first_allowed(last + step, step, mask, until, tz)
+            if following is None:
+                break
+            last = following
+        until = last
+
+    return {
+        "scheduled_time": first,
+        "repeat_minutes": every_minutes,
+        "repeat_days": mask,
+        "repeat_until": until,
+        "repeat_count": count or None,
+    }
+
+
+def occurrences(record, after=None, limit=None, tz=None):
+    # Upcoming doses of a schedule from its next one on, or only those
+    # strictly after `after`; jumps straight to `after` instead of stepping
+    t = record.scheduled_time
+    if not is_recurring(record):
+        if after is None or t > after:
+            yield t
+        return
+
+    step = timedelta(minutes=record.repeat_minutes)
+    if after is not None and after >= t:
+        t += step * ((after - t) // step + 1)
+    produced = 0
+    while limit is None or produced < limit:
+        t = _first_allowed(t, step, record.repeat_days, record.repeat_until, tz)
+        if t is None:
+            return
+        yield t
+        produced += 1
+        t += step
+
+
+def fire_occurrence(record, tz=None):
+    # Copies the dose that is due now into its own row (returned, not added
+    # to any session) and moves the schedule to the next dose, or marks it
+    # Completed when the course is over
+    values = {attr.key: getattr(record, attr.key) for attr in inspect(type(record)).column_attrs
+              if attr.key not in SCHEDULE_COLUMNS}
+    occurrence = type(record)(parent_id=record.id, scheduled_time=record.scheduled_time, **values)
+
+    following = next(occurrences(record, after=record.scheduled_time, limit=1, tz=tz), None)
+    if following is None:
+        record.status = "Completed"
+    else:
+        record.scheduled_time = following
+    record.claimed_by = None
+    record.lease_expires = None
+    return occurrence
+
+
+def expand_listing(rows, schedules, after=None, limit=None, tz=None):
+    # Merges stored rows (already past `after`, ordered, at most `limit`)
+    # with the upcoming doses of `schedules`, keyed on (scheduled_time, id)
+    items = list(rows)
+    start = after[0] - timedelta(microseconds=1) if after else None
+    per_schedule = limit + 1 if limit is not None else None  # one may tie with the cursor
+    for schedule in schedules:
+        for t in occurrences(schedule, after=start, limit=per_schedule, tz=tz):
+            if after is None or (t, schedule.id) > tuple(after):
+                items.append(Occurrence(schedule.id, schedule.name, schedule.category, t, schedule.status))
+    items.sort(key=lambda item: (item.scheduled_time, item.id))
+    return items[:limit] if limit is not None else items
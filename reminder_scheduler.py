@@ -0,0 +1,113 @@
+import heapq
+import threading
+import traceback
+from datetime import datetime
+
+# ------------------------------------------------------------
+# EVENT-DRIVEN REMINDER SCHEDULER
+# ------------------------------------------------------------
+# Keeps the upcoming (scheduled_time, record id) pairs in a min-heap and
+# sleeps exactly until the earliest one is due instead of polling the table.
+# add() wakes the thread early when a new reminder is due sooner than the
+# current head. The heap is rebuilt from the database on start() and merged
+# again every `resync` seconds to pick up rows written by other processes.
+
+
+class ReminderScheduler:
+    def __init__(self, load_pending, fire, resync=3600, now=datetime.now):
+        # load_pending() -> iterable of (scheduled_time, id) still to fire;
+        # fire(ids) handles every reminder that has come due, in one batch
+        self.load_pending = load_pending
+        self.fire = fire
+        self.resync = resync
+        self.now = now
+
+        self._heap = []
+        self._ids = set()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self._next_resync = None
+
+    def start(self):
+        with self._cond:
+            self._merge(self.load_pending())
+            if self._thread is None:
+                self._stop = False
+                self._thread = threading.Thread(target=self._loop, name="reminder-scheduler", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def add(self, scheduled_time, record_id):
+        with self._cond:
+            if record_id in self._ids:
+                return
+            earliest = self._heap[0][0] if self._heap else None
+            self._push(scheduled_time, record_id)
+            if earliest is None or scheduled_time < earliest:
+                self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap)
+
+    def _push(self, scheduled_time, record_id):
+        heapq.heappush(self._heap, (scheduled_time, record_id))
+        self._ids.add(record_id)
+
+    def _merge(self, entries):
+        for scheduled_time, record_id in entries:
+            if record_id not in self._ids:
+                self._push(scheduled_time, record_id)
+        self._next_resync = self.now().timestamp() + self.resync if self.resync else None
+
+    def _pop_due(self):
+        now = self.now()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, record_id = heapq.heappop(self._heap)
+            self._ids.discard(record_id)
+            due.append(record_id)
+        return due
+
+    def _timeout(self):
+        # Seconds until the next reminder or resync, None = sleep until add()
+        now = self.now()
+        deadlines = []
+        if self._heap:
+            deadlines.append((self._heap[0][0] - now).total_seconds())
+        if self._next_resync is not None:
+            deadlines.append(self._next_resync - now.timestamp())
+        return max(0.0, min(deadlines)) if deadlines else None
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._stop:
+                    due = self._pop_due()
+                    if due:
+                        break
+                    if self._next_resync is not None and self.now().timestamp() >= self._next_resync:
+                        self._next_resync += self.resync
+                        due = None
+                        break
+                    self._cond.wait(self._timeout())
+                if self._stop:
+                    return
+
+            try:
+                if due is None:
+                    entries = list(self.load_pending())
+                    with self._cond:
+                        self._merge(entries)
+                else:
+                    self.fire(due)
+            except Exception:
+                traceback.print_exc()
@@ -0,0 +1,184 @@
+import queue
+import smtplib
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import inc, stage
+
+# ------------------------------------------------------------
+# POOLED SMTP DELIVERY
+# ------------------------------------------------------------
+# Keeps up to `size` logged-in SMTP connections open and reuses them, so a
+# burst of reminders costs one TLS handshake + login per connection instead
+# of one per mail. A batch is spread over the pooled connections; a dropped
+# connection is reopened and the message retried with exponential backoff,
+# and an optional rate limit (messages / second) is shared by all of them.
+#
+# For local testing point it at a debugging server, e.g.
+#   python -m aiosmtpd -n -l localhost:1025
+#   SMTPPool("localhost", 1025, use_ssl=False)
+
+# Errors that are about the message itself: retrying will not help
+PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused,
+                    smtplib.SMTPNotSupportedError)
+
+
+class RateLimiter:
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class SMTPPool:
+    def __init__(self, host, port, username=None, password=None, use_ssl=True,
+                 starttls=False, size=3, max_retries=3, backoff=1.0, rate_limit=None,
+                 timeout=30, idle_check=60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.starttls = starttls
+        self.size = size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.idle_check = idle_check
+        self.limiter = RateLimiter(rate_limit) if rate_limit else None
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.stats = {"sent": 0, "failed": 0, "retries": 0, "connects": 0}
+        self.batches = deque(maxlen=100)
+
+    # ---------- connections ----------
+    def _connect(self):
+        if self.use_ssl:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.starttls:
+                server.starttls()
+        if self.username:
+            server.login(self.username, self.password)
+        with self._lock:
+            self.stats["connects"] += 1
+        return server
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            server, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+        # Servers drop idle sessions; probe before reusing an old one
+        if time.monotonic() - last_used > self.idle_check:
+            try:
+                if server.noop()[0] != 250:
+                    raise smtplib.SMTPServerDisconnected("noop failed")
+            except (smtplib.SMTPException, OSError):
+                _quietly_close(server)
+                return self._connect()
+        return server
+
+    def _release(self, server, broken=False):
+        try:
+            if broken or server is None:
+                _quietly_close(server)
+            else:
+                self._idle.put((server, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                _quietly_close(server)
+
+    # ---------- sending ----------
+    def send(self, message):
+        with stage("smtp_send"):
+            self._send(message)
+
+    def _send(self, message):
+        # Sends one EmailMessage, reconnecting / backing off on transient errors
+        for attempt in range(self.max_retries + 1):
+            if self.limiter:
+                self.limiter.wait()
+            server = None
+            try:
+                server = self._acquire()
+                server.send_message(message)
+            except PERMANENT_ERRORS:
+                self._release(server)
+                self._count("failed")
+                raise
+            except (smtplib.SMTPException, OSError):
+                self._release(server, broken=True)
+                if attempt == self.max_retries:
+                    self._count("failed")
+                    raise
+                self._count("retries")
+                time.sleep(self.backoff * (2 ** attempt))
+            else:
+                self._release(server)
+                self._count("sent")
+                return
+
+    def send_batch(self, messages):
+        # Returns one entry per message: None when sent, else the exception
+        start = time.perf_counter()
+        errors = [None] * len(messages)
+
+        def deliver(i):
+            try:
+                self.send(messages[i])
+            except Exception as e:
+                errors[i] = e
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.size, len(messages)))) as workers:
+            list(workers.map(deliver, range(len(messages))))
+
+        seconds = time.perf_counter() - start
+        sent = sum(error is None for error in errors)
+        self.batches.append({
+            "messages": len(messages),
+            "sent": sent,
+            "failed": len(messages) - sent,
+            "seconds": seconds,
+            "per_second": sent / seconds if seconds else 0.0
+        })
+        return errors
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+        inc(f"smtp_{key}")
+
+
+def _quietly_close(server):
+    if server is None:
+        return
+    try:
+        server.close()
+    except OSError:
+        pass
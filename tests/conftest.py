@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# The apps write reference CSVs to the working directory and open their
+# database at import time: keep both in a scratch directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="health-tests-")
+os.environ.setdefault("HEALTH_DB_URL", "sqlite:///" + os.path.join(WORKDIR, "tests.db"))
+os.chdir(WORKDIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
@@ -0,0 +1,31 @@
+import backend
+from synth_pdf import lab_bundle, lab_report
+
+CATALOG = {test: {"aliases": [], "unit": "", "min": 1, "max": 10}
+           for test in ("Hemoglobin", "RBC Count", "MCV", "Platelets")}
+
+
+def written(values):
+    # The synthetic header / noise lines may happen to match other tests
+    return {test: value for test, value in values.items() if test in CATALOG}
+
+
+def write(tmp_path, name, pdf):
+    path = tmp_path / name
+    path.write_bytes(pdf)
+    return str(path)
+
+
+def test_analyze_file_reads_a_report(tmp_path):
+    pdf, expected = lab_report(CATALOG, seed=1)
+    report = backend.analyze_file(write(tmp_path, "report.pdf", pdf))
+    assert "error" not in report
+    assert written(report["values"]) == expected
+
+
+def test_analyze_file_splits_a_bundle(tmp_path):
+    pdf, reports = lab_bundle(CATALOG, patients=3, seed=1)
+    report = backend.analyze_file(write(tmp_path, "bundle.pdf", pdf), split=True)
+    assert "error" not in report
+    assert [p["first_page"] for p in report["patients"]] == [first + 1 for first, _ in reports]
+    assert [written(p["values"]) for p in report["patients"]] == [expected for _, expected in reports]
@@ -0,0 +1,34 @@
+import threading
+import time
+
+from sqlalchemy import text
+
+from db_migrations import add_column, migrate
+from health_db import create_health_engine
+
+
+def test_concurrent_migrations_apply_each_step_once(tmp_path):
+    url = f"sqlite:///{tmp_path / 'health.db'}"
+    steps = [
+        (1, "table", ["CREATE TABLE IF NOT EXISTS t (id INTEGER PRIMARY KEY)"]),
+        (2, "column", [lambda conn: time.sleep(0.3), add_column("t", "x", "INTEGER")]),
+        (3, "row", ["INSERT INTO t (x) VALUES (1)"]),
+    ]
+    applied, errors = [], []
+
+    def run():
+        try:
+            applied.append(migrate(create_health_engine(url), "t", steps))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(version for done in applied for version in done) == [1, 2, 3]
+    with create_health_engine(url).connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM t")).scalar() == 1
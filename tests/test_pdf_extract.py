@@ -0,0 +1,15 @@
+import pytest
+
+from pdf_extract import split_reports
+from synth_pdf import lab_bundle
+
+CATALOG = {"Hemoglobin": {"aliases": [], "unit": "g/dL", "min": 13, "max": 17}}
+
+
+@pytest.mark.parametrize("numbering", [None, "report", "bundle"])
+def test_split_reports_starts_a_report_per_patient(numbering):
+    pdf, reports = lab_bundle(CATALOG, patients=3, seed=1, result_pages=2, noise_pages=1,
+                              numbering=numbering)
+    split = list(split_reports(pdf))
+    assert [patient for patient, _, _ in split] == [f"TEST PATIENT {seed}" for seed in (1, 2, 3)]
+    assert [first for _, first, _ in split] == [first for first, _ in reports]
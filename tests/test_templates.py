@@ -0,0 +1,26 @@
+import backend
+from lab_templates import LEARN_AFTER, LayoutTemplates
+from synth_pdf import lab_report
+
+TESTS = tuple(backend.MedicalInterpreter().get_known_tests())
+
+
+def catalog(tests):
+    return {test: {"aliases": [], "unit": "", "min": 1, "max": 10} for test in tests}
+
+
+def scan(pdf):
+    stats = {}
+    return backend.scan_pdf(pdf, TESTS, stats=stats), stats.get("template", False)
+
+
+def test_template_is_learned_from_a_partial_report_and_serves_larger_ones(monkeypatch):
+    small, _ = lab_report(catalog(TESTS[:6]), seed=3)
+    large, _ = lab_report(catalog(TESTS[:34]), seed=4)
+    full, _ = scan(large)
+
+    monkeypatch.setattr(backend, "layout_templates", LayoutTemplates())
+    for _ in range(LEARN_AFTER):
+        assert scan(small)[1] is False
+    assert scan(small)[1] is True
+    assert scan(large) == (full, True)
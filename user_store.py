@@ -0,0 +1,246 @@
+import hashlib
+import hmac
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Column, DateTime, Index, Integer, String, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from db_migrations import migrate
+
+# ------------------------------------------------------------
+# SHARED USER STORE
+# ------------------------------------------------------------
+# Users and login sessions for login_user.py and final.py, kept in the
+# shared health_tracker.db so registrations survive restarts and are seen
+# by every worker process. Passwords are stored as salted scrypt hashes;
+# session tokens are random and only their SHA-256 is stored. Validating a
+# token goes through a bounded in-process TTL cache, so authenticated
+# requests / reruns normally do not touch the database. A logout in one
+# process is seen by the others once their cached entry expires
+# (cache_ttl).
+
+UserBase = declarative_base()
+
+
+class User(UserBase):
+    __tablename__ = "users"
+    id = Column(Integer, primary_key=True)
+    username = Column(String(100), nullable=False)
+    email = Column(String(200))
+    password_hash = Column(String(300), nullable=False)
+    created_at = Column(DateTime)
+
+    __table_args__ = (Index("ix_users_username", "username", unique=True),)
+
+
+class UserSession(UserBase):
+    __tablename__ = "user_sessions"
+    token_hash = Column(String(64), primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (Index("ix_user_sessions_expires", "expires_at"),)
+
+
+USER_MIGRATIONS = [
+    (1, "unique index users(username), index user_sessions(expires_at)",
+     ["CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username ON users (username)",
+      "CREATE INDEX IF NOT EXISTS ix_user_sessions_expires ON user_sessions (expires_at)"]),
+]
+
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# ---------- password hashing ----------
+# scrypt cost N (a power of two): each doubling doubles both the time and
+# the memory (128 * r * N bytes) a login takes. Pick it with
+#   python user_store.py [target_ms]
+# and set PASSWORD_HASH_N; stored hashes carry their own parameters and are
+# upgraded on the next successful login when the setting changes.
+HASH_N = int(os.environ.get("PASSWORD_HASH_N", 2 ** 14))
+HASH_R = 8
+HASH_P = 1
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * r * n + 1024 * 1024, dklen=32)
+
+
+def hash_password(password, n=HASH_N):
+    salt = os.urandom(16)
+    digest = _scrypt(password, salt, n, HASH_R, HASH_P)
+    return f"scrypt${n}${HASH_R}${HASH_P}${salt.hex()}${digest.hex()}"
+
+
+def verify_password(password, stored):
+    try:
+        _, n, r, p, salt, digest = stored.split("$")
+        expected = _scrypt(password, bytes.fromhex(salt), int(n), int(r), int(p))
+    except ValueError:
+        return False
+    return hmac.compare_digest(expected.hex(), digest)
+
+
+def needs_rehash(stored, n=HASH_N):
+    return stored.split("$")[1:4] != [str(n), str(HASH_R), str(HASH_P)]
+
+
+def tune_hash_cost(target_ms=250, max_n=2 ** 20):
+    # Largest N whose hash still takes at most target_ms on this machine
+    n, best = 2 ** 10, 2 ** 10
+    while n <= max_n:
+        start = time.perf_counter()
+        _scrypt("benchmark", b"0" * 16, n, HASH_R, HASH_P)
+        if (time.perf_counter() - start) * 1000 > target_ms:
+            break
+        best, n = n, n * 2
+    return best
+
+
+def _token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+# ---------- session token cache ----------
+class SessionCache:
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, token):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None:
+                expires, user = entry
+                if now < expires:
+                    self._entries.move_to_end(token)
+                    self.stats["hits"] += 1
+                    return user
+                del self._entries[token]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, token, user, expires_at=None):
+        # Never cache past the session's own expiry
+        expires = time.time() + self.ttl
+        if expires_at is not None:
+            expires = min(expires, expires_at.replace(tzinfo=timezone.utc).timestamp())
+        with self._lock:
+            self._entries[token] = (expires, user)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def discard(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+
+class UserStore:
+    def __init__(self, engine, session_ttl=7 * 24 * 3600, cache_size=10000, cache_ttl=300,
+                 hash_n=HASH_N):
+        self.Session = sessionmaker(bind=engine)
+        self.session_ttl = timedelta(seconds=session_ttl)
+        self.hash_n = hash_n
+        self.cache = SessionCache(cache_size, cache_ttl)
+        # Unknown usernames are checked against this so they take as long as real ones
+        self._dummy_hash = hash_password("", hash_n)
+
+        UserBase.metadata.create_all(engine)
+        migrate(engine, "users", USER_MIGRATIONS)
+
+    @staticmethod
+    def _public(user):
+        return {"id": user.id, "username": user.username, "email": user.email}
+
+    def register(self, username, email, password):
+        # Returns the new user, or None if the username is taken
+        password_hash = hash_password(password, self.hash_n)
+        with self.Session() as session:
+            user = User(username=username, email=email, password_hash=password_hash,
+                        created_at=utc_now())
+            session.add(user)
+            try:
+                session.commit()
+            except IntegrityError:
+                session.rollback()
+                return None
+            return self._public(user)
+
+    def authenticate(self, username, password):
+        with self.Session() as session:
+            user = session.query(User).filter(User.username == username).first()
+            if user is None:
+                verify_password(password, self._dummy_hash)
+                return None
+            if not verify_password(password, user.password_hash):
+                return None
+            if needs_rehash(user.password_hash, self.hash_n):
+                user.password_hash = hash_password(password, self.hash_n)
+                session.commit()
+            return self._public(user)
+
+    # ---------- sessions ----------
+    def create_session(self, user):
+        token = secrets.token_urlsafe(32)
+        expires_at = utc_now() + self.session_ttl
+        with self.Session() as session:
+            session.add(UserSession(token_hash=_token_hash(token), user_id=user["id"],
+                                    expires_at=expires_at))
+            session.commit()
+        self.cache.put(token, user, expires_at)
+        return token
+
+    def get_session(self, token):
+        # The logged-in user for a token, or None if unknown / expired
+        if not token:
+            return None
+        user = self.cache.get(token)
+        if user is not None:
+            return user
+        with self.Session() as session:
+            row = (session.query(UserSession, User)
+                   .join(User, User.id == UserSession.user_id)
+                   .filter(UserSession.token_hash == _token_hash(token),
+                           UserSession.expires_at > utc_now())
+                   .first())
+            if row is None:
+                return None
+            user = self._public(row.User)
+            self.cache.put(token, user, row.UserSession.expires_at)
+            return user
+
+    def end_session(self, token):
+        self.cache.discard(token)
+        with self.Session() as session:
+            session.execute(delete(UserSession).where(UserSession.token_hash == _token_hash(token)))
+            session.commit()
+
+    def purge_expired(self):
+        with self.Session() as session:
+            removed = session.execute(
+                delete(UserSession).where(UserSession.expires_at <= utc_now())
+            ).rowcount
+            session.commit()
+        return removed
+
+
+if __name__ == "__main__":
+    target = float(sys.argv[1]) if len(sys.argv) > 1 else 250
+    n = tune_hash_cost(target)
+    print(f"PASSWORD_HASH_N={n}  (<= {target:.0f} ms per login on this machine)")